@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from typing import List, Dict, AnyStr, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import dataiku
+from dataiku.customrecipe import get_recipe_config, get_input_names_for_role, get_output_names_for_role
+
+from plugin_io_utils import ErrorHandlingEnum, ParallelEngineEnum, validate_column_input
+from dku_io_utils import set_column_description, process_dataset_chunks, write_run_report
+from azure_nlp_api_client import API_EXCEPTIONS, AzureNLPAPIWrapper, build_batch_kwargs
+from api_parallelizer import api_parallelizer
+from api_checkpoint import CheckpointJournal
+from azure_nlp_api_formatting import (
+    build_formatting_process_pool,
+    EntityTypeEnum,
+    LanguageDetectionAPIFormatter,
+    SentimentAnalysisAPIFormatter,
+    NamedEntityRecognitionAPIFormatter,
+    KeyPhraseExtractionAPIFormatter,
+)
+
+# ==============================================================================
+# SETUP
+# ==============================================================================
+
+api_configuration_preset = get_recipe_config().get("api_configuration_preset")
+parallel_engine = ParallelEngineEnum[api_configuration_preset.get("parallel_engine") or "THREADS"]
+parallel_workers = api_configuration_preset.get("parallel_workers")
+if parallel_engine == ParallelEngineEnum.ASYNCIO:
+    parallel_workers = api_configuration_preset.get("async_concurrency")
+batch_size = api_configuration_preset.get("batch_size")
+chunk_size = api_configuration_preset.get("chunk_size")
+text_column = get_recipe_config().get("text_column")
+text_language = get_recipe_config().get("language")
+language_column = get_recipe_config().get("language_column")
+services = get_recipe_config().get("services", [])
+if len(services) == 0:
+    raise ValueError("Please select at least one analysis")
+country_hint = get_recipe_config().get("country_hint", "")
+entity_types = [EntityTypeEnum[i] for i in get_recipe_config().get("entity_types", [])]
+minimum_score = float(get_recipe_config().get("minimum_score", 0))
+if minimum_score < 0 or minimum_score > 1:
+    raise ValueError("Minimum confidence score must be between 0 and 1")
+num_key_phrases = int(get_recipe_config().get("num_key_phrases", 3))
+error_handling = ErrorHandlingEnum[get_recipe_config().get("error_handling")]
+
+input_dataset_name = get_input_names_for_role("input_dataset")[0]
+input_dataset = dataiku.Dataset(input_dataset_name)
+input_schema = input_dataset.read_schema()
+input_columns_names = [col["name"] for col in input_schema]
+
+output_dataset_name = get_output_names_for_role("output_dataset")[0]
+output_dataset = dataiku.Dataset(output_dataset_name)
+run_report_folder_names = get_output_names_for_role("run_report_folder")
+
+validate_column_input(text_column, input_columns_names)
+uses_language_column = text_language == "language_column" and services != ["language_detection"]
+if uses_language_column:
+    validate_column_input(language_column, input_columns_names)
+api_wrapper = AzureNLPAPIWrapper(api_configuration_preset)  # Shared by all services, with a single API quota
+formatting_pool = build_formatting_process_pool(api_configuration_preset.get("formatting_processes"))
+input_df = pd.DataFrame(columns=input_columns_names)
+
+# Azure service, wrapper method, column prefix and formatter of each selected analysis
+service_configurations = OrderedDict()
+if "language_detection" in services:
+    service_configurations["language_detection"] = (
+        "languages",
+        api_wrapper.detect_language,
+        "lang_detect_api",
+        LanguageDetectionAPIFormatter(
+            input_df=input_df, column_prefix="lang_detect_api", error_handling=error_handling
+        ),
+    )
+if "sentiment_analysis" in services:
+    service_configurations["sentiment_analysis"] = (
+        "sentiment",
+        api_wrapper.analyze_sentiment,
+        "sentiment_api",
+        SentimentAnalysisAPIFormatter(input_df=input_df, column_prefix="sentiment_api", error_handling=error_handling),
+    )
+if "named_entity_recognition" in services:
+    service_configurations["named_entity_recognition"] = (
+        "entities/recognition/general",
+        api_wrapper.recognize_entities_general,
+        "entity_api",
+        NamedEntityRecognitionAPIFormatter(
+            input_df=input_df,
+            entity_types=entity_types,
+            minimum_score=minimum_score,
+            column_prefix="entity_api",
+            error_handling=error_handling,
+        ),
+    )
+if "key_phrase_extraction" in services:
+    service_configurations["key_phrase_extraction"] = (
+        "keyPhrases",
+        api_wrapper.extract_keyphrases,
+        "keyphrase_api",
+        KeyPhraseExtractionAPIFormatter(
+            input_df=input_df,
+            num_key_phrases=num_key_phrases,
+            column_prefix="keyphrase_api",
+            error_handling=error_handling,
+        ),
+    )
+
+api_input_columns = [text_column]
+if uses_language_column:
+    api_input_columns.append(language_column)
+
+# With the threads engine, services run at the same time and split the concurrency of the preset,
+# so that requests in flight stay within the connection pool of the wrapper
+service_parallel_workers = parallel_workers
+if parallel_engine == ParallelEngineEnum.THREADS:
+    service_parallel_workers = max(int(parallel_workers) // len(service_configurations), 1)
+batch_kwargs = {
+    k: build_batch_kwargs(service=service, batch_size=batch_size, text_column=text_column)
+    for k, (service, _, _, _) in service_configurations.items()
+}
+concurrency_controllers = {
+    k: api_wrapper.build_concurrency_controller(batch_size=v["batch_size"], max_concurrency=service_parallel_workers)
+    for k, v in batch_kwargs.items()
+}
+checkpoint_journals = {}
+if api_configuration_preset.get("use_checkpoint"):
+    checkpoint_journals = {
+        k: CheckpointJournal(
+            checkpoint_directory=api_configuration_preset.get("checkpoint_directory"),
+            run_id="{}.{}".format(output_dataset.full_name, column_prefix),
+        )
+        for k, (_, _, column_prefix, _) in service_configurations.items()
+    }
+
+
+# ==============================================================================
+# RUN
+# ==============================================================================
+
+
+def call_api_service(
+    batch: List[Dict],
+    api_function: Callable,
+    text_column: AnyStr,
+    text_language: AnyStr = None,
+    language_column: AnyStr = None,
+    country_hint: AnyStr = None,
+) -> List[Dict]:
+    documents = [{"id": str(index), "text": str(row.get(text_column, "")).strip()} for index, row in enumerate(batch)]
+    for document, row in zip(documents, batch):
+        if country_hint is not None:
+            document["countryHint"] = country_hint
+        elif text_language == "language_column":
+            document["language"] = str(row.get(language_column, ""))
+        else:
+            document["language"] = text_language
+    responses = api_function({"documents": documents})
+    return responses
+
+
+def compute_service_columns(df: pd.DataFrame, service_name: AnyStr) -> pd.DataFrame:
+    """
+    Call the API service of an analysis on a chunk, and return only the formatted output columns
+    """
+    _, api_function, column_prefix, api_formatter = service_configurations[service_name]
+    language_kwargs = {"text_language": text_language, "language_column": language_column}
+    if service_name == "language_detection":
+        language_kwargs = {"country_hint": country_hint}
+    api_df = api_parallelizer(
+        input_df=df,
+        api_call_function=call_api_service,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=column_prefix,
+        api_function=api_function,
+        text_column=text_column,
+        parallel_workers=service_parallel_workers,
+        parallel_engine=parallel_engine,
+        api_input_columns=api_input_columns,
+        deduplication_columns=api_input_columns,
+        checkpoint_journal=checkpoint_journals.get(service_name),
+        telemetry=api_wrapper.telemetry,
+        concurrency_controller=concurrency_controllers[service_name],
+        error_handling=error_handling,
+        **language_kwargs,
+        **batch_kwargs[service_name]
+    )
+    output_df = api_formatter.format_df(api_df, process_pool=formatting_pool)
+    return output_df[[c for c in output_df.columns if c not in df.columns]]
+
+
+def compute_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    if parallel_engine == ParallelEngineEnum.ASYNCIO:
+        # The asyncio engine already keeps many calls in flight on one event loop, so services run one after another
+        service_dfs = [compute_service_columns(df, service_name) for service_name in service_configurations]
+    else:
+        with ThreadPoolExecutor(max_workers=len(service_configurations)) as pool:
+            service_dfs = list(
+                pool.map(lambda service_name: compute_service_columns(df, service_name), service_configurations)
+            )
+    output_df = pd.concat([df] + service_dfs, axis=1)
+    return output_df
+
+
+process_dataset_chunks(
+    input_dataset=input_dataset, output_dataset=output_dataset, func=compute_chunk, chunksize=chunk_size
+)
+api_wrapper.log_connection_stats()
+api_wrapper.endpoint_pool.log_stats()
+api_wrapper.telemetry.log_summary()
+if len(run_report_folder_names) != 0:
+    write_run_report(
+        folder=dataiku.Folder(run_report_folder_names[0]),
+        report=api_wrapper.build_run_report(),
+        run_name="multi_service_analysis",
+    )
+api_wrapper.close()
+if formatting_pool is not None:
+    formatting_pool.close()
+for checkpoint_journal in checkpoint_journals.values():
+    checkpoint_journal.complete()
+
+column_description_dict = {}
+for _, _, _, api_formatter in service_configurations.values():
+    column_description_dict.update(api_formatter.column_description_dict)
+set_column_description(
+    input_dataset=input_dataset, output_dataset=output_dataset, column_description_dict=column_description_dict
+)
@@ -1,27 +1,29 @@
 # -*- coding: utf-8 -*-
-from typing import List, Dict, AnyStr
+from typing import List, Dict, AnyStr, Tuple, Union
 
-from retry import retry
-from ratelimit import limits, RateLimitException
+import pandas as pd
 
 import dataiku
 from dataiku.customrecipe import get_recipe_config, get_input_names_for_role, get_output_names_for_role
 
-from plugin_io_utils import ErrorHandlingEnum, validate_column_input
-from dku_io_utils import set_column_description
-from azure_nlp_api_client import API_EXCEPTIONS, batch_api_response_parser, AzureNLPAPIWrapper
+from plugin_io_utils import ErrorHandlingEnum, ParallelEngineEnum, validate_column_input
+from dku_io_utils import set_column_description, process_dataset_chunks, write_run_report
+from azure_nlp_api_client import API_EXCEPTIONS, AzureNLPAPIWrapper, build_batch_kwargs
 from api_parallelizer import api_parallelizer
-from azure_nlp_api_formatting import EntityTypeEnum, NamedEntityRecognitionAPIFormatter
+from api_checkpoint import CheckpointJournal
+from azure_nlp_api_formatting import EntityTypeEnum, NamedEntityRecognitionAPIFormatter, build_formatting_process_pool
 
 # ==============================================================================
 # SETUP
 # ==============================================================================
 
 api_configuration_preset = get_recipe_config().get("api_configuration_preset")
-api_quota_rate_limit = api_configuration_preset.get("api_quota_rate_limit")
-api_quota_period = api_configuration_preset.get("api_quota_period")
+parallel_engine = ParallelEngineEnum[api_configuration_preset.get("parallel_engine") or "THREADS"]
 parallel_workers = api_configuration_preset.get("parallel_workers")
+if parallel_engine == ParallelEngineEnum.ASYNCIO:
+    parallel_workers = api_configuration_preset.get("async_concurrency")
 batch_size = api_configuration_preset.get("batch_size")
+chunk_size = api_configuration_preset.get("chunk_size")
 text_column = get_recipe_config().get("text_column")
 text_language = get_recipe_config().get("language")
 language_column = get_recipe_config().get("language_column")
@@ -30,6 +32,7 @@ minimum_score = float(get_recipe_config().get("minimum_score", 0))
 if minimum_score < 0 or minimum_score > 1:
     raise ValueError("Minimum confidence score must be between 0 and 1")
 error_handling = ErrorHandlingEnum[get_recipe_config().get("error_handling")]
+entity_columns = bool(get_recipe_config().get("entity_columns", True))
 
 input_dataset_name = get_input_names_for_role("input_dataset")[0]
 input_dataset = dataiku.Dataset(input_dataset_name)
@@ -38,19 +41,43 @@ input_columns_names = [col["name"] for col in input_schema]
 
 output_dataset_name = get_output_names_for_role("output_dataset")[0]
 output_dataset = dataiku.Dataset(output_dataset_name)
+run_report_folder_names = get_output_names_for_role("run_report_folder")
+entities_dataset = None
+if len(get_output_names_for_role("entities_dataset")) != 0:
+    entities_dataset = dataiku.Dataset(get_output_names_for_role("entities_dataset")[0])
+if not entity_columns and entities_dataset is None:
+    raise ValueError("Please enable entity columns or add an entities dataset to output entities")
 
 validate_column_input(text_column, input_columns_names)
 if text_language == "language_column":
     validate_column_input(language_column, input_columns_names)
-input_df = input_dataset.get_dataframe()
 api_wrapper = AzureNLPAPIWrapper(api_configuration_preset)
+formatting_pool = build_formatting_process_pool(api_configuration_preset.get("formatting_processes"))
 column_prefix = "entity_api"
+api_formatter = NamedEntityRecognitionAPIFormatter(
+    input_df=pd.DataFrame(columns=input_columns_names),
+    entity_types=entity_types,
+    minimum_score=minimum_score,
+    column_prefix=column_prefix,
+    error_handling=error_handling,
+    wide_output=entity_columns,
+    row_id_output=entities_dataset is not None,
+)
 
-batch_kwargs = {
-    "api_support_batch": True,
-    "batch_size": batch_size,
-    "batch_api_response_parser": batch_api_response_parser,
-}
+batch_kwargs = build_batch_kwargs(
+    service="entities/recognition/general", batch_size=batch_size, text_column=text_column
+)
+api_input_columns = [text_column]
+if text_language == "language_column":
+    api_input_columns.append(language_column)
+
+concurrency_controller = api_wrapper.build_concurrency_controller(batch_size=batch_kwargs["batch_size"])
+checkpoint_journal = None
+if api_configuration_preset.get("use_checkpoint"):
+    checkpoint_journal = CheckpointJournal(
+        checkpoint_directory=api_configuration_preset.get("checkpoint_directory"),
+        run_id="{}.{}".format(output_dataset.full_name, column_prefix),
+    )
 
 
 # ==============================================================================
@@ -58,8 +85,6 @@ batch_kwargs = {
 # ==============================================================================
 
 
-@retry((RateLimitException, OSError), delay=api_quota_period, tries=5)
-@limits(calls=api_quota_rate_limit, period=api_quota_period)
 def call_api_named_entity_recognition(
     batch: List[Dict], text_column: AnyStr, text_language: AnyStr, language_column: AnyStr = None,
 ) -> List[Dict]:
@@ -77,31 +102,57 @@ def call_api_named_entity_recognition(
     return responses
 
 
-df = api_parallelizer(
-    input_df=input_df,
-    api_call_function=call_api_named_entity_recognition,
-    api_exceptions=API_EXCEPTIONS,
-    column_prefix=column_prefix,
-    text_column=text_column,
-    text_language=text_language,
-    language_column=language_column,
-    parallel_workers=parallel_workers,
-    error_handling=error_handling,
-    **batch_kwargs
-)
-
-api_formatter = NamedEntityRecognitionAPIFormatter(
-    input_df=input_df,
-    entity_types=entity_types,
-    minimum_score=minimum_score,
-    column_prefix=column_prefix,
-    error_handling=error_handling,
+def compute_chunk(df: pd.DataFrame) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    df = api_parallelizer(
+        input_df=df,
+        api_call_function=call_api_named_entity_recognition,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=column_prefix,
+        text_column=text_column,
+        text_language=text_language,
+        language_column=language_column,
+        parallel_workers=parallel_workers,
+        parallel_engine=parallel_engine,
+        api_input_columns=api_input_columns,
+        deduplication_columns=api_input_columns,
+        checkpoint_journal=checkpoint_journal,
+        telemetry=api_wrapper.telemetry,
+        concurrency_controller=concurrency_controller,
+        error_handling=error_handling,
+        **batch_kwargs
+    )
+    output_df = api_formatter.format_df(df, process_pool=formatting_pool)
+    if entities_dataset is not None:
+        return (output_df, api_formatter.format_long_df(df))
+    return output_df
+
+
+process_dataset_chunks(
+    input_dataset=input_dataset,
+    output_dataset=output_dataset,
+    func=compute_chunk,
+    chunksize=chunk_size,
+    secondary_output_dataset=entities_dataset,
 )
-output_df = api_formatter.format_df(df)
+api_wrapper.log_connection_stats()
+api_wrapper.endpoint_pool.log_stats()
+api_wrapper.telemetry.log_summary()
+if len(run_report_folder_names) != 0:
+    write_run_report(
+        folder=dataiku.Folder(run_report_folder_names[0]), report=api_wrapper.build_run_report(), run_name=column_prefix
+    )
+api_wrapper.close()
+if formatting_pool is not None:
+    formatting_pool.close()
+if checkpoint_journal is not None:
+    checkpoint_journal.complete()
 
-output_dataset.write_with_schema(output_df)
 set_column_description(
     input_dataset=input_dataset,
     output_dataset=output_dataset,
     column_description_dict=api_formatter.column_description_dict,
 )
+if entities_dataset is not None:
+    set_column_description(
+        output_dataset=entities_dataset, column_description_dict=api_formatter.long_column_description_dict
+    )
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Module with a durable checkpoint journal to resume interrupted API runs without calling the API again"""
+
+import logging
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+from typing import AnyStr, Dict, List, NamedTuple
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+JOURNAL_EXTENSION = ".checkpoint.sqlite"
+DEFAULT_MAX_AGE_DAYS = 7
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class CheckpointJournal:
+    """
+    Durable journal of completed API results, backed by a local SQLite file:
+    - each row is keyed by its row number in the dataset and a hash of the payload and parameters sent to the API
+    - successful results (response and error columns) are committed after every completed batch
+    - a rerun with the same inputs skips rows found in the journal, and recomputes changed rows
+    - the journal is deleted when the run completes, along with stale journals of abandoned runs
+    """
+
+    def __init__(self, checkpoint_directory: AnyStr, run_id: AnyStr, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        if not checkpoint_directory:
+            raise ValueError("Checkpointing is enabled but no checkpoint directory is set, please edit the preset")
+        self.checkpoint_directory = str(checkpoint_directory)
+        os.makedirs(self.checkpoint_directory, exist_ok=True)
+        file_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(run_id)) + JOURNAL_EXTENSION
+        self.journal_path = os.path.join(self.checkpoint_directory, file_name)
+        self.max_age_days = float(max_age_days)
+        self.row_offset = 0
+        self.num_resumed_rows = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.journal_path, timeout=60, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+            num_rows = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if num_rows != 0:
+            logging.info("Resuming from checkpoint {} with {} completed rows".format(self.journal_path, num_rows))
+        else:
+            logging.info("Checkpointing API results to {}".format(self.journal_path))
+
+    def compute_key(self, row_number: int, payload: Dict, parameters: Dict = None) -> AnyStr:
+        """
+        Key a row by its row number and a hash of its payload and of the parameters of the API call, e.g. the language
+        """
+        payload_json = json.dumps([payload, parameters or {}], sort_keys=True, default=str)
+        payload_hash = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()
+        return "{}:{}".format(row_number, payload_hash)
+
+    def get(self, key: AnyStr) -> Dict:
+        with self._lock:
+            row = self._connection.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.num_resumed_rows += 1
+        return json.loads(row[0])
+
+    def write(self, keyed_results: List[Dict], key_name: AnyStr, api_column_names: NamedTuple) -> None:
+        """
+        Commit the API columns of successful results, given the name of the key in each result
+        """
+        items = [
+            (result[key_name], json.dumps({k: result.get(k) for k in api_column_names}))
+            for result in keyed_results
+            if key_name in result
+            and result.get(api_column_names.response, "") != ""
+            and result.get(api_column_names.error_type, "") == ""
+        ]
+        if len(items) == 0:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)", items)
+
+    def advance(self, num_rows: int) -> None:
+        """
+        Move the row offset forward after a chunk of the dataset has been processed
+        """
+        self.row_offset += int(num_rows)
+
+    def complete(self) -> None:
+        """
+        Delete the journal once the run has completed, and garbage-collect stale journals of other runs
+        """
+        logging.info("Run completed, {} rows resumed from checkpoint".format(self.num_resumed_rows))
+        with self._lock:
+            self._connection.close()
+        expiry = time() - self.max_age_days * 24 * 3600
+        for file_name in os.listdir(self.checkpoint_directory):
+            file_path = os.path.join(self.checkpoint_directory, file_name)
+            is_current_journal = file_path.startswith(self.journal_path)
+            if JOURNAL_EXTENSION not in file_name or not (is_current_journal or os.path.getmtime(file_path) < expiry):
+                continue
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                logging.warning("Failed to delete checkpoint file {}: {}".format(file_path, e))
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Module with an adaptive controller of the number of in-flight API calls and the batch size"""
+
+import logging
+from typing import Optional, Union
+
+from api_rate_limiter import TokenBucketRateLimiter
+from api_endpoint_pool import EndpointPool
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_TOLERANCE = 2.0  # Congestion if latency exceeds this multiple of the lowest latency observed
+DEFAULT_MAX_ERROR_RATE = 0.1
+MIN_WINDOW_SIZE = 4  # Minimum number of completed calls between two adjustments
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class AIMDConcurrencyController:
+    """
+    Additive-increase/multiplicative-decrease (AIMD) controller of concurrency and batch size:
+    - after each window of completed calls (at least one per call in flight), look for congestion signals:
+      throttled requests (pauses of the rate limiter, or of the rate limiters of all endpoints), error rate,
+      and latency above a multiple of the lowest mean latency observed at the current batch size
+    - on throttling, halve the number of calls in flight
+    - on errors or rising latency, halve both the number of calls in flight and the batch size
+    - otherwise, add one call in flight, and grow the batch size once concurrency is at its maximum.
+      Until the first congestion signal, the number of calls in flight is doubled instead (slow start).
+    Every adjustment is logged. State is kept across calls to api_parallelizer, i.e. across chunks.
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int,
+        max_concurrency: int,
+        initial_batch_size: int = 1,
+        max_batch_size: int = 1,
+        throttle_counter: Optional[Union[TokenBucketRateLimiter, EndpointPool]] = None,
+        min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+        decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE,
+        max_error_rate: float = DEFAULT_MAX_ERROR_RATE,
+    ):
+        self.min_concurrency = max(int(min_concurrency), 1)
+        self.max_concurrency = max(int(max_concurrency), self.min_concurrency)
+        self.concurrency = min(max(int(initial_concurrency), self.min_concurrency), self.max_concurrency)
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.batch_size = min(max(int(initial_batch_size), 1), self.max_batch_size)
+        self.batch_size_step = max(self.max_batch_size // 10, 1)
+        self.throttle_counter = throttle_counter
+        self.decrease_factor = float(decrease_factor)
+        self.latency_tolerance = float(latency_tolerance)
+        self.max_error_rate = float(max_error_rate)
+        self.num_adjustments = 0
+        self._slow_start = True
+        self._baseline_latency = None
+        self._num_throttles = self._count_throttles()
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self._window_calls = 0
+        self._window_rows = 0
+        self._window_errors = 0
+        self._window_latency = 0.0
+
+    def _count_throttles(self) -> int:
+        return self.throttle_counter.num_pauses if self.throttle_counter is not None else 0
+
+    def record(self, latency: float, num_rows: int = 1, num_errors: int = 0) -> None:
+        """
+        Record a completed call, with its latency in seconds and the number of rows which failed,
+        and adjust concurrency and batch size at the end of each window
+        """
+        self._window_calls += 1
+        self._window_rows += num_rows
+        self._window_errors += num_errors
+        self._window_latency += latency
+        if self._window_calls >= max(self.concurrency, MIN_WINDOW_SIZE):
+            self._adjust()
+
+    def _adjust(self) -> None:
+        num_throttles = self._count_throttles() - self._num_throttles
+        self._num_throttles += num_throttles
+        mean_latency = self._window_latency / self._window_calls
+        error_rate = self._window_errors / max(self._window_rows, 1)
+        if self._baseline_latency is None or mean_latency < self._baseline_latency:
+            self._baseline_latency = mean_latency
+        concurrency, batch_size = self.concurrency, self.batch_size
+        if num_throttles != 0:
+            reason = "{} throttled requests".format(num_throttles)
+            concurrency = int(concurrency * self.decrease_factor)
+        elif error_rate > self.max_error_rate:
+            reason = "error rate of {:.1%}".format(error_rate)
+            concurrency = int(concurrency * self.decrease_factor)
+            batch_size = int(batch_size * self.decrease_factor)
+        elif mean_latency > self.latency_tolerance * self._baseline_latency:
+            reason = "latency of {:.0f} ms, above {:.0f} ms".format(mean_latency * 1000, self._baseline_latency * 1000)
+            concurrency = int(concurrency * self.decrease_factor)
+            batch_size = int(batch_size * self.decrease_factor)
+        elif concurrency < self.max_concurrency:
+            reason = "no congestion"
+            concurrency = concurrency * 2 if self._slow_start else concurrency + 1
+        else:
+            reason = "no congestion at maximum concurrency"
+            batch_size += self.batch_size_step
+        if concurrency < self.concurrency or batch_size < self.batch_size:
+            self._slow_start = False
+        self._set(concurrency, batch_size, reason)
+        self._reset_window()
+
+    def _set(self, concurrency: int, batch_size: int, reason: str) -> None:
+        concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        batch_size = min(max(batch_size, 1), self.max_batch_size)
+        if (concurrency, batch_size) == (self.concurrency, self.batch_size):
+            return
+        logging.info(
+            "Adaptive concurrency: {} -> {} calls in flight, batch size {} -> {} ({})".format(
+                self.concurrency, concurrency, self.batch_size, batch_size, reason
+            )
+        )
+        if batch_size != self.batch_size:
+            self._baseline_latency = None  # Latency depends on the batch size, so it is measured again
+        self.concurrency, self.batch_size = concurrency, batch_size
+        self.num_adjustments += 1
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Module to spread API requests across several endpoints, each with its own credentials and quota"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from collections import Counter
+from typing import AnyStr, Dict, Iterator, List
+
+from api_rate_limiter import TokenBucketRateLimiter
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_COOLDOWN_BASE = 1.0  # seconds
+DEFAULT_COOLDOWN_CAP = 60.0  # seconds
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class APIEndpoint:
+    """
+    One API endpoint with its base URL, authentication headers, rate limiter and load statistics.
+    Statistics are updated by the EndpointPool under its lock.
+    """
+
+    def __init__(self, name: AnyStr, base_url: AnyStr, headers: Dict, rate_limiter: TokenBucketRateLimiter):
+        self.name = name
+        self.base_url = base_url
+        self.headers = headers
+        self.rate_limiter = rate_limiter
+        self.in_flight = 0
+        self.num_requests = 0
+        self.num_documents = 0
+        self.num_consecutive_errors = 0
+        self.status_counts = Counter()
+        self.cooldown_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """
+        Time in seconds before this endpoint may serve a new request, because of its cooldown or its quota
+        """
+        return max(self.cooldown_until - now, self.rate_limiter.wait_time())
+
+
+class EndpointPool:
+    """
+    Thread-safe pool of API endpoints among which requests are balanced:
+    - send each request to the endpoint which can serve it the soonest, given its cooldown and the requests already
+      waiting for its quota, then to the one with the fewest requests in flight relative to its quota
+    - after throttling, a server error or a connection error, put the endpoint in cooldown for an exponentially
+      increasing duration, so that traffic moves to other endpoints until it recovers
+    - count requests, documents and statuses per endpoint for the run report, and throttled requests of all endpoints
+    """
+
+    def __init__(
+        self,
+        endpoints: List[APIEndpoint],
+        cooldown_base: float = DEFAULT_COOLDOWN_BASE,
+        cooldown_cap: float = DEFAULT_COOLDOWN_CAP,
+    ):
+        if len(endpoints) == 0:
+            raise ValueError("At least one API endpoint is required")
+        self.endpoints = endpoints
+        self.cooldown_base = float(cooldown_base)
+        self.cooldown_cap = float(cooldown_cap)
+        self._start_time = monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def num_pauses(self) -> int:
+        """
+        Number of pauses of the rate limiters of all endpoints, i.e. of throttled requests whatever their key
+        """
+        return sum(endpoint.rate_limiter.num_pauses for endpoint in self.endpoints)
+
+    def select(self) -> APIEndpoint:
+        """
+        Choose the endpoint of the next request and count it in flight until released
+        """
+        with self._lock:
+            now = monotonic()
+            endpoint = min(
+                self.endpoints, key=lambda e: (round(e.wait_time(now), 3), e.in_flight / e.rate_limiter.rate)
+            )
+            endpoint.in_flight += 1
+        return endpoint
+
+    def cool_down(self, endpoint: APIEndpoint, duration: float) -> None:
+        """
+        Stop sending requests to an endpoint for the given duration in seconds, unless all others are cooling down
+        """
+        with self._lock:
+            endpoint.cooldown_until = max(endpoint.cooldown_until, monotonic() + duration)
+        if len(self.endpoints) > 1:
+            logging.warning(
+                "Sending requests to other endpoints than {} for {:.1f} seconds".format(endpoint.name, duration)
+            )
+
+    def release(self, endpoint: APIEndpoint, status: AnyStr, num_documents: int = 0) -> None:
+        """
+        Record the end of a request to an endpoint with its status code or exception name.
+        Throttled and failed requests put the endpoint in cooldown, successful requests count their documents.
+        """
+        status = str(status)
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.num_requests += 1
+            endpoint.status_counts[status] += 1
+            if status.isdigit() and int(status) < 400:
+                endpoint.num_consecutive_errors = 0
+                endpoint.num_documents += num_documents
+                return
+            if status.isdigit() and int(status) < 500 and int(status) != 429:
+                return
+            endpoint.num_consecutive_errors += 1
+            cooldown = min(self.cooldown_cap, self.cooldown_base * 2 ** (endpoint.num_consecutive_errors - 1))
+        self.cool_down(endpoint, cooldown)
+
+    @contextmanager
+    def track_request(self, num_documents: int = 0) -> Iterator[Dict]:
+        """
+        Context manager around a request, yielding a dictionary with the selected "endpoint", and whose "status" key
+        is to be set to the response status code. If an exception is raised, its name is recorded as status instead.
+        """
+        request = {"endpoint": self.select(), "status": None}
+        try:
+            yield request
+        except BaseException as e:
+            request["status"] = type(e).__name__
+            raise
+        finally:
+            self.release(request["endpoint"], request["status"], num_documents)
+
+    def stats(self) -> List[Dict]:
+        """
+        Summarize the requests, documents and statuses of each endpoint in a JSON-serializable list
+        """
+        with self._lock:
+            duration = monotonic() - self._start_time
+            return [
+                {
+                    "name": endpoint.name,
+                    "requests": endpoint.num_requests,
+                    "documents": endpoint.num_documents,
+                    "documents_per_second": round(endpoint.num_documents / duration, 3) if duration > 0 else None,
+                    "status_counts": dict(endpoint.status_counts),
+                }
+                for endpoint in self.endpoints
+            ]
+
+    def close(self) -> None:
+        for endpoint in self.endpoints:
+            endpoint.rate_limiter.close()
+
+    def log_stats(self) -> List[Dict]:
+        stats = self.stats()
+        for endpoint_stats in stats:
+            logging.info(
+                "Endpoint {}: {} requests, {} documents ({:.1f} documents/s), status counts {}".format(
+                    endpoint_stats["name"],
+                    endpoint_stats["requests"],
+                    endpoint_stats["documents"],
+                    endpoint_stats["documents_per_second"] or 0.0,
+                    endpoint_stats["status_counts"],
+                )
+            )
+        return stats
@@ -4,15 +4,22 @@
 import logging
 import inspect
 import math
+import asyncio
+import threading
+from time import perf_counter
 
-from typing import Callable, AnyStr, List, Tuple, NamedTuple, Dict, Union
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, AnyStr, List, Tuple, NamedTuple, Dict, Union, Iterator
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import pandas as pd
 from more_itertools import chunked, flatten
 from tqdm.auto import tqdm as tqdm_auto
 
-from plugin_io_utils import ErrorHandlingEnum, build_unique_column_names
+from plugin_io_utils import STRING_DTYPE, ErrorHandlingEnum, ParallelEngineEnum, build_unique_column_names
+from api_checkpoint import CheckpointJournal
+from api_concurrency_controller import AIMDConcurrencyController
+from api_telemetry import APITelemetry
 
 
 # ==============================================================================
@@ -23,6 +30,15 @@ DEFAULT_PARALLEL_WORKERS = 4
 DEFAULT_BATCH_SIZE = 10
 DEFAULT_API_SUPPORT_BATCH = False
 DEFAULT_VERBOSE = False
+DEFAULT_PARALLEL_ENGINE = ParallelEngineEnum.THREADS
+THREAD_QUEUE_FACTOR = 2  # Tasks queued per thread so that workers never wait for the next submission
+ROW_INDEX_KEY = "__api_parallelizer_row_index__"  # Position of each row, to join results back in order
+PACKING_LOOKAHEAD_BATCHES = 10  # Number of batches worth of rows buffered to pack them by decreasing weight
+CHECKPOINT_KEY = "__api_parallelizer_checkpoint_key__"  # Identity of each row in the checkpoint journal
+DEFAULT_MAX_ATTEMPTS = 3  # Number of times a row with a transient error is sent, in total
+SEGMENT_KEY = "__api_parallelizer_segment__"  # Position of each segment of a split row
+
+_thread_local = threading.local()
 
 
 # ==============================================================================
@@ -84,6 +100,7 @@ def api_call_batch(
     api_exceptions: Union[Exception, Tuple[Exception]],
     error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG,
     verbose: bool = DEFAULT_VERBOSE,
+    transient_error_function: Callable = None,
     **api_call_function_kwargs
 ) -> List[Dict]:
     """
@@ -95,42 +112,303 @@ def api_call_batch(
         * (default) do not fail on API-related exceptions, just log it
         and return the batch with new error keys in each dict (using batch_api_parser)
         * fail if there is an error and raise it
+    If given, transient_error_function tells from an error type if the error is transient:
+    such errors are written in the rows even when failing on errors, so that the rows can be sent again.
     """
-    if error_handling == ErrorHandlingEnum.FAIL:
+
+    def is_transient(error_type):
+        return transient_error_function is not None and transient_error_function(error_type)
+
+    try:
         response = api_call_function(batch=batch, **api_call_function_kwargs)
         batch = batch_api_response_parser(batch=batch, response=response, api_column_names=api_column_names)
-        errors = [row[api_column_names.error_message] for row in batch if row[api_column_names.error_message] != ""]
+    except api_exceptions as e:
+        error_type = str(type(e).__qualname__)
+        module = inspect.getmodule(e)
+        if module is not None:
+            error_type = str(module.__name__) + "." + error_type
+        if error_handling == ErrorHandlingEnum.FAIL and not is_transient(error_type):
+            raise
+        logging.warning(str(e))
+        for row in batch:
+            row[api_column_names.response] = ""
+            row[api_column_names.error_message] = str(e)
+            row[api_column_names.error_type] = error_type
+            row[api_column_names.error_raw] = str(e.args)
+    if error_handling == ErrorHandlingEnum.FAIL:
+        errors = [
+            row[api_column_names.error_message]
+            for row in batch
+            if row[api_column_names.error_message] != "" and not is_transient(row[api_column_names.error_type])
+        ]
         if len(errors) != 0:
             raise BatchAPIError("Batch API returned errors: " + str(errors))
-    else:
-        try:
-            response = api_call_function(batch=batch, **api_call_function_kwargs)
-            batch = batch_api_response_parser(batch=batch, response=response, api_column_names=api_column_names)
-        except api_exceptions as e:
-            logging.warning(str(e))
-            error_type = str(type(e).__qualname__)
-            module = inspect.getmodule(e)
-            if module is not None:
-                error_type = str(module.__name__) + "." + error_type
-            for row in batch:
-                row[api_column_names.response] = ""
-                row[api_column_names.error_message] = str(e)
-                row[api_column_names.error_type] = error_type
-                row[api_column_names.error_raw] = str(e.args)
     return batch
 
 
+def pack_batches(
+    df_iterator: Iterator[Dict], batch_size: int, max_batch_weight: float, row_weight_function: Callable
+) -> Iterator[List[Dict]]:
+    """
+    Group rows into batches of at most batch_size rows and max_batch_weight in total (e.g. characters),
+    using as few batches as possible. Rows are buffered a few batches ahead, sorted by decreasing weight
+    and put in the first batch where they fit (First-Fit Decreasing bin packing).
+    A row heavier than max_batch_weight on its own is sent in a batch of its own.
+    """
+    for buffer in chunked(df_iterator, batch_size * PACKING_LOOKAHEAD_BATCHES):
+        batches = []
+        batch_weights = []
+        open_batch_positions = []
+        weighted_rows = sorted(((row_weight_function(row), row) for row in buffer), key=lambda x: x[0], reverse=True)
+        for weight, row in weighted_rows:
+            for position in open_batch_positions:
+                if batch_weights[position] + weight <= max_batch_weight:
+                    batches[position].append(row)
+                    batch_weights[position] += weight
+                    if len(batches[position]) >= batch_size:
+                        open_batch_positions.remove(position)
+                    break
+            else:
+                batches.append([row])
+                batch_weights.append(weight)
+                if batch_size > 1 and weight < max_batch_weight:
+                    open_batch_positions.append(len(batches) - 1)
+        for batch in batches:
+            yield batch
+
+
+def adaptive_batches(
+    df_iterator: Iterator[Dict],
+    batch_size_function: Callable,
+    max_batch_weight: float = None,
+    row_weight_function: Callable = None,
+) -> Iterator[List[Dict]]:
+    """
+    Group rows into batches whose size is read from batch_size_function when each batch starts,
+    so that it can be adjusted during the run. If a maximum weight is given, a batch is also
+    closed before its total weight goes over it, as long as it has at least one row.
+    """
+    batch, batch_weight, batch_size = [], 0, batch_size_function()
+    for row in df_iterator:
+        weight = row_weight_function(row) if max_batch_weight is not None and row_weight_function is not None else 0
+        if len(batch) != 0 and (len(batch) >= batch_size or batch_weight + weight > (max_batch_weight or math.inf)):
+            yield batch
+            batch, batch_weight, batch_size = [], 0, batch_size_function()
+        batch.append(row)
+        batch_weight += weight
+    if len(batch) != 0:
+        yield batch
+
+
+def group_rows_in_batches(
+    df_iterator: Iterator[Dict],
+    batch_size: int,
+    max_batch_weight: float = None,
+    row_weight_function: Callable = None,
+    concurrency_controller: AIMDConcurrencyController = None,
+) -> Tuple[Iterator[List[Dict]], AnyStr]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Group rows into batches: of adaptive size if a concurrency controller is given, packed up to a maximum weight
+    if a weight function is given, or in fixed-size chunks otherwise.
+    Return the batch iterator and a description of the batching.
+    """
+    if concurrency_controller is not None:
+        batches = adaptive_batches(
+            df_iterator, lambda: concurrency_controller.batch_size, max_batch_weight, row_weight_function
+        )
+        return (batches, "with adaptive batch size")
+    if max_batch_weight is not None and row_weight_function is not None:
+        batches = pack_batches(df_iterator, batch_size, max_batch_weight, row_weight_function)
+        description = "chunked by {} and packed up to a weight of {}".format(batch_size, max_batch_weight)
+        return (batches, description)
+    return (chunked(df_iterator, batch_size), "chunked by {}".format(batch_size))
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return an event loop dedicated to the current thread, kept open across calls
+    so that asynchronous HTTP sessions can be reused from one chunk to the next
+    """
+    loop = getattr(_thread_local, "event_loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _thread_local.event_loop = loop
+    return loop
+
+
+async def _await_api_call(api_call_function: Callable, **api_call_function_kwargs) -> Callable:
+    """
+    Helper function to the asyncio engine.
+    Call a function which may return an awaitable, and return a function which replays
+    its result or exception, to be used in api_call_batch or api_call_single_row.
+    """
+    try:
+        response = api_call_function(**api_call_function_kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+    except Exception as e:
+        exception = e
+
+        def replay_exception(**kwargs):
+            raise exception
+
+        return replay_exception
+
+    def replay_response(**kwargs):
+        return response
+
+    return replay_response
+
+
+async def api_call_async(
+    api_call_wrapper: Callable, item_name: AnyStr, item: Union[Dict, List[Dict]], **pool_kwargs
+) -> Union[Dict, List[Dict]]:
+    """
+    Asynchronous version of api_call_batch and api_call_single_row (passed as api_call_wrapper).
+    The API calling function may return an awaitable, which is awaited without blocking the event loop.
+    """
+    wrapper_parameters = inspect.signature(api_call_wrapper).parameters
+    api_call_function_kwargs = {k: v for k, v in pool_kwargs.items() if k not in wrapper_parameters}
+    api_call_function_kwargs[item_name] = item
+    replay = await _await_api_call(pool_kwargs["api_call_function"], **api_call_function_kwargs)
+    wrapper_kwargs = {**pool_kwargs, "api_call_function": replay, item_name: item}
+    return api_call_wrapper(**wrapper_kwargs)
+
+
+def _select_api_call_wrapper(api_support_batch: bool) -> Tuple[Callable, AnyStr]:
+    if api_support_batch:
+        return (api_call_batch, "batch")
+    return (api_call_single_row, "row")
+
+
+def track_submitted_rows(progress_bar: tqdm_auto, num_submitted_rows: int, item: Union[Dict, List[Dict]]) -> int:
+    """
+    Helper function to the engines.
+    Count the rows of a submitted row or batch, and raise the total of the progress bar when more rows
+    are submitted than estimated, e.g. segments of long rows. Return the number of rows submitted so far.
+    """
+    num_submitted_rows += len(item) if isinstance(item, list) else 1
+    if num_submitted_rows > (progress_bar.total or 0):
+        progress_bar.total = num_submitted_rows
+    return num_submitted_rows
+
+
+def _run_thread_engine(
+    df_iterator: Iterator,
+    num_rows: int,
+    parallel_workers: int,
+    api_support_batch: bool,
+    result_callback: Callable = None,
+    concurrency_controller: AIMDConcurrencyController = None,
+    **pool_kwargs
+) -> List:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Submit work to a thread pool through a bounded window of in-flight tasks, refilled as tasks complete,
+    so that memory stays flat and the first results are collected right away.
+    If given, result_callback is called on each completed row or batch with its latency, from the calling thread.
+    If given, the concurrency controller sets the number of tasks in flight, up to its maximum number of threads.
+    Progress is counted in rows: num_rows is an estimate, corrected as rows come off the iterator,
+    since rows may be resumed from a checkpoint or split into segments, and batches packed or resized.
+    """
+    api_call_wrapper, item_name = _select_api_call_wrapper(api_support_batch)
+    num_threads = parallel_workers
+    if concurrency_controller is not None:
+        num_threads = concurrency_controller.max_concurrency
+    api_results = []
+    start_times = {}
+
+    def collect(done):
+        for f in done:
+            api_results.append(f.result())
+            if result_callback is not None:
+                result_callback(api_results[-1], perf_counter() - start_times.pop(f))
+            progress_bar.update(len(api_results[-1]) if api_support_batch else 1)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as pool, tqdm_auto(total=num_rows) as progress_bar:
+        futures = set()
+        num_submitted_rows = 0
+        for item in df_iterator:
+            num_submitted_rows = track_submitted_rows(progress_bar, num_submitted_rows, item)
+            window_size = parallel_workers * THREAD_QUEUE_FACTOR
+            if concurrency_controller is not None:
+                window_size = concurrency_controller.concurrency
+            while len(futures) >= window_size:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = pool.submit(api_call_wrapper, **{item_name: item}, **pool_kwargs)
+            start_times[future] = perf_counter()
+            futures.add(future)
+        progress_bar.total = num_submitted_rows
+        collect(wait(futures).done)
+    return api_results
+
+
+async def _run_asyncio_engine(
+    df_iterator: Iterator,
+    num_rows: int,
+    parallel_workers: int,
+    api_support_batch: bool,
+    result_callback: Callable = None,
+    concurrency_controller: AIMDConcurrencyController = None,
+    **pool_kwargs
+) -> List:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Keep up to parallel_workers API calls in flight on the current thread's event loop,
+    scheduling a new call from the iterator as soon as one completes.
+    If given, result_callback is called on each completed row or batch with its latency.
+    If given, the concurrency controller sets the number of calls in flight instead of parallel_workers.
+    Progress is counted in rows: num_rows is an estimate, corrected as rows come off the iterator,
+    since rows may be resumed from a checkpoint or split into segments, and batches packed or resized.
+    """
+    api_call_wrapper, item_name = _select_api_call_wrapper(api_support_batch)
+    api_results = []
+    start_times = {}
+
+    def collect(done):
+        for t in done:
+            api_results.append(t.result())
+            if result_callback is not None:
+                result_callback(api_results[-1], perf_counter() - start_times.pop(t))
+            progress_bar.update(len(api_results[-1]) if api_support_batch else 1)
+
+    with tqdm_auto(total=num_rows) as progress_bar:
+        tasks = set()
+        num_submitted_rows = 0
+        for item in df_iterator:
+            num_submitted_rows = track_submitted_rows(progress_bar, num_submitted_rows, item)
+            window_size = parallel_workers
+            if concurrency_controller is not None:
+                window_size = concurrency_controller.concurrency
+            while len(tasks) >= window_size:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+            task = asyncio.ensure_future(api_call_async(api_call_wrapper, item_name, item, **pool_kwargs))
+            start_times[task] = perf_counter()
+            tasks.add(task)
+        progress_bar.total = num_submitted_rows
+        if len(tasks) != 0:
+            done, _ = await asyncio.wait(tasks)
+            collect(done)
+    return api_results
+
+
 def convert_api_results_to_df(
     input_df: pd.DataFrame,
     api_results: List[Dict],
     api_column_names: NamedTuple,
     error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG,
     verbose: bool = DEFAULT_VERBOSE,
+    row_group_index: List[int] = None,
 ) -> pd.DataFrame:
     """
     Helper function to the "api_parallelizer" main function.
     Combine API results (list of dict) with input dataframe,
     and convert it to a dataframe.
+    Results are joined back to the input rows by position, so that row order is preserved.
+    If rows were deduplicated, row_group_index maps each input row to the position of its unique result.
     """
     if error_handling == ErrorHandlingEnum.FAIL:
         columns_to_exclude = [v for k, v in api_column_names._asdict().items() if "error" in k]
@@ -138,16 +416,145 @@ def convert_api_results_to_df(
         columns_to_exclude = []
         if not verbose:
             columns_to_exclude = [api_column_names.error_raw]
-    output_schema = {**{v: str for v in api_column_names}, **dict(input_df.dtypes)}
-    output_schema = {k: v for k, v in output_schema.items() if k not in columns_to_exclude}
-    record_list = [{col: result.get(col) for col in output_schema.keys()} for result in api_results]
     api_column_list = [c for c in api_column_names if c not in columns_to_exclude]
-    output_column_list = list(input_df.columns) + api_column_list
-    output_df = pd.DataFrame.from_records(record_list).astype(output_schema).reindex(columns=output_column_list)
+    record_list = [None] * len(api_results)
+    for result in api_results:
+        record_list[result[ROW_INDEX_KEY]] = [result.get(col) for col in api_column_list]
+    api_columns = OrderedDict()
+    for i, column_name in enumerate(api_column_list):
+        values = [record[i] for record in record_list]
+        if column_name == api_column_names.response:
+            # decoded responses are kept as is, to be serialized to JSON only when written
+            api_columns[column_name] = [v if isinstance(v, (dict, list)) else str(v) for v in values]
+        else:
+            api_columns[column_name] = pd.Series([str(v) for v in values], dtype=STRING_DTYPE)
+    api_df = pd.DataFrame(api_columns, columns=api_column_list)
+    if row_group_index is not None:
+        api_df = api_df.iloc[row_group_index]
+    api_df.index = input_df.index
+    output_df = pd.concat([input_df, api_df], axis=1)
     assert len(output_df.index) == len(input_df.index)
     return output_df
 
 
+def group_duplicate_rows(input_df: pd.DataFrame, deduplication_columns: List[AnyStr]) -> Tuple[pd.DataFrame, List[int]]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Group rows by their normalized payload on the deduplication columns (stringified, stripped of whitespace).
+    Return the first row of each group, and the group position of every input row.
+    """
+    normalized_df = pd.DataFrame({i: input_df[c].astype(str).str.strip() for i, c in enumerate(deduplication_columns)})
+    row_group_index = normalized_df.groupby(list(normalized_df.columns), sort=False).ngroup()
+    unique_df = input_df[~row_group_index.duplicated().values]
+    num_rows = len(input_df.index)
+    logging.info(
+        "Deduplication: {} rows, {} unique payloads sent to the API ({:.1%} duplicates).".format(
+            num_rows, len(unique_df.index), 1 - len(unique_df.index) / num_rows if num_rows != 0 else 0
+        )
+    )
+    return (unique_df, list(row_group_index))
+
+
+def skip_checkpointed_rows(
+    df_iterator: Iterator[Dict],
+    checkpoint_journal: CheckpointJournal,
+    row_numbers: List[int],
+    checkpointed_results: List[Dict],
+    call_parameters: Dict = None,
+) -> Iterator[Dict]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Look up each row in the checkpoint journal by its row number, payload and the parameters of the API call,
+    so that changing a parameter such as the language does not resume results computed with its previous value:
+    rows already completed are appended to checkpointed_results with their API columns,
+    other rows are yielded with their checkpoint key, to be journaled once completed.
+    """
+    for row in df_iterator:
+        payload = {k: v for k, v in row.items() if k != ROW_INDEX_KEY}
+        key = checkpoint_journal.compute_key(row_numbers[row[ROW_INDEX_KEY]], payload, call_parameters)
+        checkpointed_result = checkpoint_journal.get(key)
+        if checkpointed_result is not None:
+            checkpointed_results.append({**row, **checkpointed_result})
+        else:
+            row[CHECKPOINT_KEY] = key
+            yield row
+
+
+def split_rows(df_iterator: Iterator[Dict], split_function: Callable) -> Iterator[Dict]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Replace each row by the rows returned by split_function, e.g. segments of a long text,
+    numbered so that their results can be merged back once completed.
+    """
+    for row in df_iterator:
+        segment_rows = split_function(row)
+        if len(segment_rows) == 1:
+            yield segment_rows[0]
+            continue
+        for i, segment_row in enumerate(segment_rows):
+            segment_row[SEGMENT_KEY] = i
+            yield segment_row
+
+
+def merge_segment_results(
+    segment_results: List[Dict], merge_function: Callable, api_column_names: NamedTuple
+) -> List[Dict]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Merge the results of the segments of each split row into one result per row:
+    if all segments succeeded, merge_function combines the segment rows and their responses into one response,
+    else the row takes the error of its first failed segment.
+    """
+    segment_results_by_index = OrderedDict()
+    for result in segment_results:
+        segment_results_by_index.setdefault(result[ROW_INDEX_KEY], []).append(result)
+    merged_results = []
+    for results in segment_results_by_index.values():
+        results.sort(key=lambda result: result[SEGMENT_KEY])
+        failed_results = [r for r in results if r.get(api_column_names.response, "") == ""]
+        merged_result = {k: v for k, v in (failed_results or results)[0].items() if k != SEGMENT_KEY}
+        if len(failed_results) == 0:
+            merged_result[api_column_names.response] = merge_function(
+                results, [r[api_column_names.response] for r in results]
+            )
+        merged_results.append(merged_result)
+    if len(merged_results) != 0:
+        logging.info(
+            "Segmentation: {} long rows were split into {} segments.".format(len(merged_results), len(segment_results))
+        )
+    return merged_results
+
+
+def requeue_transient_errors(
+    api_results: List[Dict],
+    run_engine: Callable,
+    api_column_names: NamedTuple,
+    transient_error_function: Callable,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> List[Dict]:
+    """
+    Helper function to the "api_parallelizer" main function.
+    Send rows whose error type is classified as transient again, in new batches, until they succeed
+    or have been sent max_attempts times in total. Rows which succeeded, or failed with a permanent error,
+    are never sent again.
+    """
+    results_by_index = OrderedDict(((r[ROW_INDEX_KEY], r.get(SEGMENT_KEY)), r) for r in api_results)
+    for attempt in range(2, max_attempts + 1):
+        retry_rows = [
+            {k: v for k, v in result.items() if k not in api_column_names}
+            for result in results_by_index.values()
+            if transient_error_function(result.get(api_column_names.error_type, ""))
+        ]
+        if len(retry_rows) == 0:
+            break
+        logging.info(
+            "Requeuing {} rows with transient errors, attempt {}/{}".format(len(retry_rows), attempt, max_attempts)
+        )
+        for result in run_engine(iter(retry_rows), len(retry_rows)):
+            results_by_index[(result[ROW_INDEX_KEY], result.get(SEGMENT_KEY))] = result
+    return list(results_by_index.values())
+
+
 def api_parallelizer(
     input_df: pd.DataFrame,
     api_call_function: Callable,
@@ -158,6 +565,18 @@ def api_parallelizer(
     batch_size: int = DEFAULT_BATCH_SIZE,
     error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG,
     verbose: bool = DEFAULT_VERBOSE,
+    parallel_engine: ParallelEngineEnum = DEFAULT_PARALLEL_ENGINE,
+    deduplication_columns: List[AnyStr] = None,
+    api_input_columns: List[AnyStr] = None,
+    max_batch_weight: float = None,
+    row_weight_function: Callable = None,
+    checkpoint_journal: CheckpointJournal = None,
+    concurrency_controller: AIMDConcurrencyController = None,
+    telemetry: APITelemetry = None,
+    transient_error_function: Callable = None,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    split_function: Callable = None,
+    merge_function: Callable = None,
     **api_call_function_kwargs
 ) -> pd.DataFrame:
     """
@@ -165,16 +584,52 @@ def api_parallelizer(
     The DataFrame is passed to the function as row dictionaries.
     Parallelism works by:
     - (default) sending multiple concurrent threads
-    - if the API supports it, sending batches of row
+    - with the asyncio engine, keeping many calls in flight on a single thread:
+      the API call function may then return an awaitable
+    - if the API supports it, sending batches of row, optionally packed up to a maximum weight per batch
+      (e.g. number of characters) computed by row_weight_function
+    If deduplication columns are given, rows with identical payloads on these columns are sent once,
+    and their results are copied back to every matching row.
+    If API input columns are given, only these columns are passed to the function, in compact row dictionaries,
+    and results are joined back to the input dataframe by row position.
+    If a checkpoint journal is given, completed rows are journaled after each batch, and rows found in the journal
+    from a previous run are not sent again. Successive calls are assumed to process successive chunks of a dataset.
+    If a concurrency controller is given, the number of calls in flight and the batch size are adjusted
+    during the run from the latency and errors of completed calls.
+    If a telemetry collector is given, the latency and number of rows of each completed call are recorded,
+    progress is logged at regular intervals, and the final outcome of each input row is recorded at the end.
+    If a transient error function is given, rows whose error type it classifies as transient are sent again
+    in later batches, up to max_attempts times in total. If errors are set to fail the run, it only fails
+    on permanent errors, or on transient errors remaining after the last attempt.
+    If split and merge functions are given, each row is passed to split_function, which may return several rows,
+    e.g. segments of a text too long for the API. Segments are sent like any other row, and the responses
+    of the segments of a row are combined by merge_function.
     """
-    df_iterator = (i[1].to_dict() for i in input_df.iterrows())
-    len_iterator = len(input_df.index)
-    log_msg = "Calling remote API endpoint with {} rows...".format(len_iterator)
-    if api_support_batch:
-        log_msg += ", chunked by {}".format(batch_size)
-        df_iterator = chunked(df_iterator, batch_size)
-        len_iterator = math.ceil(len_iterator / batch_size)
-    logging.info(log_msg)
+    unique_df, row_group_index = input_df, None
+    if deduplication_columns:
+        unique_df, row_group_index = group_duplicate_rows(input_df, deduplication_columns)
+    if api_input_columns:
+        missing_columns = [c for c in api_input_columns if c not in input_df.columns]
+        if len(missing_columns) != 0:
+            raise ValueError("API input columns {} are not present in the input dataframe".format(missing_columns))
+        unique_df = unique_df[list(api_input_columns)]
+    column_names = list(unique_df.columns)
+    df_iterator = (
+        {**dict(zip(column_names, values)), ROW_INDEX_KEY: i}
+        for i, values in enumerate(unique_df.itertuples(index=False, name=None))
+    )
+    checkpointed_results = []
+    if checkpoint_journal is not None:
+        unique_positions = range(len(input_df.index))
+        if row_group_index is not None:
+            unique_positions = [i for i, d in enumerate(pd.Series(row_group_index).duplicated()) if not d]
+        row_numbers = [checkpoint_journal.row_offset + i for i in unique_positions]
+        call_parameters = {k: v for k, v in api_call_function_kwargs.items() if not callable(v)}
+        df_iterator = skip_checkpointed_rows(
+            df_iterator, checkpoint_journal, row_numbers, checkpointed_results, call_parameters
+        )
+    if split_function is not None and merge_function is not None:
+        df_iterator = split_rows(df_iterator, split_function)
     api_column_names = build_unique_column_names(input_df.columns, column_prefix)
     pool_kwargs = api_call_function_kwargs.copy()
     more_kwargs = [
@@ -185,20 +640,92 @@ def api_parallelizer(
     ]
     for k in more_kwargs:
         pool_kwargs[k] = locals()[k]
-    for k in ["fn", "row", "batch"]:  # Reserved pool keyword arguments
+    for k in ["fn", "row", "batch", "result_callback", "concurrency_controller", "telemetry"]:  # Reserved arguments
         pool_kwargs.pop(k, None)
-    api_results = []
-    with ThreadPoolExecutor(max_workers=parallel_workers) as pool:
+    if api_support_batch:
+        pool_kwargs["transient_error_function"] = transient_error_function
+    result_callback = None
+    if checkpoint_journal is not None or concurrency_controller is not None or telemetry is not None:
+
+        def record_result(result, latency):
+            rows = result if api_support_batch else [result]
+            if checkpoint_journal is not None:
+                # segments are journaled once merged, as their row would be resumed from a single segment otherwise
+                checkpoint_journal.write([r for r in rows if SEGMENT_KEY not in r], CHECKPOINT_KEY, api_column_names)
+            num_errors = sum(row.get(api_column_names.error_type, "") != "" for row in rows)
+            if concurrency_controller is not None:
+                concurrency_controller.record(latency, len(rows), num_errors)
+            if telemetry is not None:
+                telemetry.record_call(latency, len(rows))
+
+        result_callback = record_result
+
+    batching_kwargs = {
+        "batch_size": batch_size,
+        "max_batch_weight": max_batch_weight,
+        "row_weight_function": row_weight_function,
+        "concurrency_controller": concurrency_controller,
+    }
+
+    def run_engine(rows_iterator, num_rows):
+        log_msg = "Calling remote API endpoint with {} rows...".format(num_rows)
         if api_support_batch:
-            futures = [pool.submit(api_call_batch, batch=batch, **pool_kwargs) for batch in df_iterator]
+            rows_iterator, batching_description = group_rows_in_batches(rows_iterator, **batching_kwargs)
+            log_msg += ", " + batching_description
+        logging.info(log_msg)
+        engine_args = (
+            rows_iterator,
+            num_rows,
+            parallel_workers,
+            api_support_batch,
+            result_callback,
+            concurrency_controller,
+        )
+        if parallel_engine == ParallelEngineEnum.ASYNCIO:
+            results = get_event_loop().run_until_complete(_run_asyncio_engine(*engine_args, **pool_kwargs))
         else:
-            futures = [pool.submit(api_call_single_row, row=row, **pool_kwargs) for row in df_iterator]
-        for f in tqdm_auto(as_completed(futures), total=len_iterator):
-            api_results.append(f.result())
-    if api_support_batch:
-        api_results = flatten(api_results)
-    output_df = convert_api_results_to_df(input_df, api_results, api_column_names, error_handling, verbose)
+            results = _run_thread_engine(*engine_args, **pool_kwargs)
+        if api_support_batch:
+            results = list(flatten(results))
+        return results
+
+    api_results = run_engine(df_iterator, len(unique_df.index))
+    if transient_error_function is not None:
+        api_results = requeue_transient_errors(
+            api_results, run_engine, api_column_names, transient_error_function, max_attempts
+        )
+        transient_errors = [
+            result[api_column_names.error_message]
+            for result in api_results
+            if transient_error_function(result.get(api_column_names.error_type, ""))
+        ]
+        if error_handling == ErrorHandlingEnum.FAIL and len(transient_errors) != 0:
+            raise BatchAPIError(
+                "API returned transient errors after {} attempts: {}".format(max_attempts, transient_errors)
+            )
+    if split_function is not None and merge_function is not None:
+        merged_results = merge_segment_results(
+            [r for r in api_results if SEGMENT_KEY in r], merge_function, api_column_names
+        )
+        if checkpoint_journal is not None:
+            checkpoint_journal.write(merged_results, CHECKPOINT_KEY, api_column_names)
+        api_results = [r for r in api_results if SEGMENT_KEY not in r] + merged_results
+    if checkpoint_journal is not None:
+        if len(checkpointed_results) != 0:
+            logging.info("Checkpoint: {} rows resumed from a previous run".format(len(checkpointed_results)))
+        api_results.extend(checkpointed_results)
+        checkpoint_journal.advance(len(input_df.index))
+    output_df = convert_api_results_to_df(
+        input_df, api_results, api_column_names, error_handling, verbose, row_group_index
+    )
     num_api_error = sum(output_df[api_column_names.response] == "")
     num_api_success = len(input_df.index) - num_api_error
+    if telemetry is not None:
+        num_resumed_rows = 0
+        if len(checkpointed_results) != 0:
+            resumed_row_indices = {result[ROW_INDEX_KEY] for result in checkpointed_results}
+            row_indices = row_group_index if row_group_index is not None else range(len(input_df.index))
+            num_resumed_rows = sum(i in resumed_row_indices for i in row_indices)
+        telemetry.record_rows(len(input_df.index), num_api_error, num_resumed_rows)
     logging.info("Remote API call results: {} rows succeeded, {} rows failed.".format(num_api_success, num_api_error))
     return output_df
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Module with a rate limiter shared by all workers calling an API, and retry utilities"""
+
+import asyncio
+import random
+import threading
+from time import sleep, monotonic, time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_BURST = 1
+DEFAULT_BACKOFF_BASE = 1.0  # seconds
+DEFAULT_BACKOFF_CAP = 60.0  # seconds
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token bucket shared by all workers calling an API:
+    - pace calls smoothly at rate_limit calls per period, with bursts of at most `burst` calls
+    - reserve tokens under a lock and wait outside of it, so that waiting workers are served in order
+    - pause all workers for a given duration, e.g. as requested by a Retry-After header
+    """
+
+    def __init__(self, rate_limit: int, period: float, burst: int = DEFAULT_BURST):
+        if rate_limit <= 0 or period <= 0:
+            raise ValueError("Rate limit and period must be positive")
+        self.rate = float(rate_limit) / float(period)  # tokens per second
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._updated_at = monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.total_wait_time = 0.0
+        self.num_pauses = 0
+
+    def _reserve(self) -> float:
+        """
+        Take one token, possibly in advance, and return the time to wait before using it
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait_time = max(-self._tokens / self.rate, self._paused_until - now, 0.0)
+            self.total_wait_time += wait_time
+        return wait_time
+
+    def wait_time(self) -> float:
+        """
+        Return the time a worker would wait if it took a token now, without taking it
+        """
+        with self._lock:
+            now = monotonic()
+            tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate) - 1
+            return max(-tokens / self.rate, self._paused_until - now, 0.0)
+
+    def acquire(self) -> float:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            sleep(wait_time)
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+    def pause(self, duration: float) -> None:
+        """
+        Prevent all workers from acquiring tokens for the given duration in seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic() + duration)
+            self.num_pauses += 1
+
+    def close(self) -> None:
+        """
+        Release the resources held by the rate limiter, if any
+        """
+        pass
+
+
+def parse_retry_after(headers: Dict) -> Optional[float]:
+    """
+    Parse the delay in seconds from the Retry-After header (in seconds or HTTP date format)
+    or the retry-after-ms header sent by Azure. Return None if absent or invalid.
+    """
+    headers = {str(k).lower(): v for k, v in (headers or {}).items()}
+    if "retry-after-ms" in headers:
+        try:
+            return max(float(headers["retry-after-ms"]) / 1000.0, 0.0)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def compute_backoff(attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_CAP) -> float:
+    """
+    Exponential backoff with full jitter: random delay between 0 and min(cap, base * 2^attempt)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
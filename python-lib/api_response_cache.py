@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Module with a persistent cache of API responses, addressed by the content of each document"""
+
+import logging
+import os
+import json
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from time import time
+from typing import AnyStr, Dict, List, Tuple
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "dss-plugin-azure-cognitive-services-nlp", "cache.sqlite")
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_ENTRIES = 1000000
+SQLITE_MAX_VARIABLES = 900  # Below the default SQLITE_MAX_VARIABLE_NUMBER of old SQLite versions
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class APIResponseCache:
+    """
+    Persistent cache of API responses backed by a local SQLite database:
+    - each document is addressed by a hash of the service, API version and document content
+    - entries older than a maximum age or beyond a maximum number of entries are evicted
+    - all entries are invalidated when the API version changes
+    - hit/miss counters are logged on close
+    """
+
+    def __init__(
+        self,
+        api_version: AnyStr,
+        cache_path: AnyStr = DEFAULT_CACHE_PATH,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.api_version = str(api_version)
+        self.cache_path = str(cache_path or DEFAULT_CACHE_PATH)
+        self.max_age_days = float(max_age_days or DEFAULT_MAX_AGE_DAYS)
+        self.max_entries = int(max_entries or DEFAULT_MAX_ENTRIES)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        cache_directory = os.path.dirname(self.cache_path)
+        if cache_directory:
+            os.makedirs(cache_directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.cache_path, timeout=60, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+        self._invalidate_other_versions()
+        self.evict()
+        logging.info("Response cache loaded from {}".format(self.cache_path))
+
+    def _invalidate_other_versions(self) -> None:
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value FROM metadata WHERE name = 'api_version'").fetchone()
+            if row is not None and row[0] != self.api_version:
+                logging.info("API version changed from {} to {}, invalidating cache".format(row[0], self.api_version))
+                self._connection.execute("DELETE FROM responses")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES ('api_version', ?)", (self.api_version,)
+            )
+
+    def evict(self) -> None:
+        """
+        Delete entries older than the maximum age, then the least recently used entries beyond the maximum size
+        """
+        with self._lock, self._connection:
+            expiry = time() - self.max_age_days * 24 * 3600
+            num_expired = self._connection.execute("DELETE FROM responses WHERE created_at < ?", (expiry,)).rowcount
+            num_entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            num_excess = max(num_entries - self.max_entries, 0)
+            if num_excess != 0:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (num_excess,),
+                )
+        if num_expired + num_excess != 0:
+            logging.info("Evicted {} expired and {} excess entries from cache".format(num_expired, num_excess))
+
+    def compute_key(self, service: AnyStr, document: Dict, params: Dict = None) -> AnyStr:
+        """
+        Hash the service, API version, parameters and document content (text, language/countryHint)
+        """
+        content = {k: v for k, v in document.items() if k != "id"}
+        key_items = [service, self.api_version, content, params or {}]
+        return hashlib.sha256(json.dumps(key_items, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[AnyStr]) -> Dict[AnyStr, Dict]:
+        """
+        Return cached responses for the given keys, and update hit/miss counters
+        """
+        cached_responses = {}
+        unique_keys = list(set(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), SQLITE_MAX_VARIABLES):
+                keys_slice = unique_keys[i : i + SQLITE_MAX_VARIABLES]
+                query = "SELECT key, response FROM responses WHERE key IN ({})".format(",".join("?" * len(keys_slice)))
+                cached_responses.update(
+                    {k: json.loads(r) for k, r in self._connection.execute(query, keys_slice).fetchall()}
+                )
+            if len(cached_responses) != 0:
+                with self._connection:
+                    self._connection.executemany(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?", [(time(), k) for k in cached_responses]
+                    )
+            num_hits = sum(k in cached_responses for k in keys)
+            self.hits += num_hits
+            self.misses += len(keys) - num_hits
+        return cached_responses
+
+    def set_many(self, items: List[Tuple[AnyStr, Dict]]) -> None:
+        if len(items) == 0:
+            return
+        now = time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(r), now, now) for k, r in items],
+            )
+
+    def log_stats(self) -> Dict:
+        num_requests = self.hits + self.misses
+        hit_rate = self.hits / num_requests if num_requests != 0 else 0
+        logging.info("Response cache: {} hits, {} misses ({:.1%} hit rate).".format(self.hits, self.misses, hit_rate))
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self.evict()
+        self.log_stats()
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Module with a rate limiter whose quota is shared by all processes of a node calling an API with the same key"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import hashlib
+import tempfile
+from time import time
+from typing import AnyStr, Tuple
+
+from api_rate_limiter import TokenBucketRateLimiter, DEFAULT_BURST
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_QUOTA_STORE_PATH = os.path.join(
+    tempfile.gettempdir(), "dss-plugin-azure-cognitive-services-nlp", "quota.sqlite"
+)
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class SharedTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket shared by all processes of a node which call an API with the same quota, e.g. concurrent recipes
+    using the same API key and endpoint:
+    - the state of the bucket is stored in a local SQLite database and updated in an exclusive transaction,
+      so that tokens left unused by idle processes are available to busy ones, up to the full quota
+    - a pause requested by one process, e.g. after HTTP 429, applies to all processes
+    - buckets are addressed by a hash of the quota key, so that API keys are never written to disk
+    - with asyncio, tokens are reserved in a thread, as the transaction may wait for other processes
+    """
+
+    def __init__(
+        self,
+        rate_limit: int,
+        period: float,
+        quota_key: AnyStr,
+        store_path: AnyStr = DEFAULT_QUOTA_STORE_PATH,
+        burst: int = DEFAULT_BURST,
+    ):
+        super().__init__(rate_limit=rate_limit, period=period, burst=burst)
+        self.bucket_key = hashlib.sha256(str(quota_key).encode("utf-8")).hexdigest()
+        self.store_path = str(store_path or DEFAULT_QUOTA_STORE_PATH)
+        store_directory = os.path.dirname(self.store_path)
+        if store_directory:
+            os.makedirs(store_directory, exist_ok=True)
+        # Transactions are handled explicitly to lock the database for writing before reading the bucket
+        self._connection = sqlite3.connect(self.store_path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, paused_until REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO buckets (key, tokens, updated_at, paused_until) VALUES (?, ?, ?, 0)",
+                (self.bucket_key, self.capacity, time()),
+            )
+        logging.info("Sharing API quota with other processes through {}".format(self.store_path))
+
+    def _read_bucket(self, now: float) -> Tuple[float, float]:
+        """
+        Return the tokens of the bucket refilled up to now, and the end of its pause. Must be called under the lock.
+        """
+        tokens, updated_at, paused_until = self._connection.execute(
+            "SELECT tokens, updated_at, paused_until FROM buckets WHERE key = ?", (self.bucket_key,)
+        ).fetchone()
+        # Clocks of processes may differ slightly, so the bucket is never refilled backwards
+        tokens = min(self.capacity, tokens + max(now - updated_at, 0.0) * self.rate)
+        return (tokens, paused_until)
+
+    def _reserve(self) -> float:
+        """
+        Take one token from the shared bucket, possibly in advance, and return the time to wait before using it
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")  # Wait for other processes to release the bucket
+            try:
+                now = time()
+                tokens, paused_until = self._read_bucket(now)
+                tokens -= 1
+                self._connection.execute(
+                    "UPDATE buckets SET tokens = ?, updated_at = ? WHERE key = ?", (tokens, now, self.bucket_key)
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            wait_time = max(-tokens / self.rate, paused_until - now, 0.0)
+            self.total_wait_time += wait_time
+        return wait_time
+
+    async def acquire_async(self) -> float:
+        """
+        Reserve a token in a thread of the default executor, so that the event loop keeps serving other calls
+        while the transaction waits for other processes, then wait for the token without blocking the loop
+        """
+        wait_time = await asyncio.get_event_loop().run_in_executor(None, self._reserve)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return wait_time
+
+    def wait_time(self) -> float:
+        with self._lock:
+            now = time()
+            tokens, paused_until = self._read_bucket(now)
+            return max(-(tokens - 1) / self.rate, paused_until - now, 0.0)
+
+    def pause(self, duration: float) -> None:
+        """
+        Prevent all workers of all processes sharing the bucket from acquiring tokens for the given duration in seconds
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE buckets SET paused_until = MAX(paused_until, ?) WHERE key = ?",
+                (time() + duration, self.bucket_key),
+            )
+            self.num_pauses += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Module to collect performance metrics of API calls and summarize them in a run report"""
+
+import logging
+import bisect
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from datetime import datetime, timezone
+from collections import Counter
+from typing import AnyStr, Dict, Iterator, Union
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+DEFAULT_PROGRESS_LOG_INTERVAL = 30.0  # seconds between two progress lines in the log
+DEFAULT_SAMPLE_INTERVAL = 1.0  # seconds between two samples of the number of requests in flight
+MAX_SAMPLES = 3600  # Beyond this number of samples, samples are merged two by two and the interval doubled
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in fixed buckets, from which approximate percentiles are computed.
+    Not thread-safe: updates must be done under the lock of the owner.
+    """
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, latency: float) -> None:
+        """
+        Add a latency in seconds
+        """
+        latency_ms = latency * 1000
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.count += 1
+        self.total += latency_ms
+        self.min = latency_ms if self.min is None else min(self.min, latency_ms)
+        self.max = latency_ms if self.max is None else max(self.max, latency_ms)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the bucket containing the q-th percentile in milliseconds, capped by the maximum latency
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank:
+                return min(upper_bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        def round_ms(latency_ms):
+            return round(latency_ms, 3) if latency_ms is not None else None
+
+        return {
+            "count": self.count,
+            "mean_ms": round_ms(self.total / self.count if self.count != 0 else None),
+            "min_ms": round_ms(self.min),
+            "max_ms": round_ms(self.max),
+            "p50_ms": round_ms(self.percentile(50)),
+            "p90_ms": round_ms(self.percentile(90)),
+            "p99_ms": round_ms(self.percentile(99)),
+            "buckets": [
+                {"le_ms": upper_bound, "count": bucket_count}
+                for upper_bound, bucket_count in zip(list(LATENCY_BUCKETS_MS) + [None], self.bucket_counts)
+            ],
+        }
+
+
+class APITelemetry:
+    """
+    Thread-safe collector of API performance metrics over a run:
+    - HTTP requests: latency histogram, status counts (or exception names), documents and characters sent,
+      retries, time spent waiting for the rate limiter, and number of requests in flight over time
+    - rows and batches sent by api_parallelizer, with periodic rows/s lines in the log,
+      and the final outcome of each input row once all its attempts and segments are done
+    - a JSON-serializable run report of all metrics at the end of the run
+    """
+
+    def __init__(
+        self,
+        progress_log_interval: float = DEFAULT_PROGRESS_LOG_INTERVAL,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        self.progress_log_interval = float(progress_log_interval)
+        self.sample_interval = float(sample_interval)
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._start_time = perf_counter()
+        self._lock = threading.Lock()
+        self.request_latency = LatencyHistogram()
+        self.call_latency = LatencyHistogram()
+        self.status_counts = Counter()
+        self.num_documents = 0
+        self.num_characters = 0
+        self.num_retries = 0
+        self.num_rate_limit_waits = 0
+        self.rate_limit_wait_time = 0.0
+        self.num_sent_rows = 0
+        self.num_rows = 0
+        self.num_failed_rows = 0
+        self.num_resumed_rows = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.in_flight_samples = []
+        self._interval_max_in_flight = 0
+        self._last_sample_time = 0.0
+        self._last_progress_log_time = 0.0
+
+    def _elapsed(self) -> float:
+        return perf_counter() - self._start_time
+
+    def _sample_in_flight(self) -> None:
+        """
+        Record the maximum number of requests in flight over each sample interval. Must be called under the lock.
+        """
+        self._interval_max_in_flight = max(self._interval_max_in_flight, self.in_flight)
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        elapsed = self._elapsed()
+        if elapsed - self._last_sample_time < self.sample_interval:
+            return
+        self.in_flight_samples.append([round(elapsed, 3), self._interval_max_in_flight])
+        self._last_sample_time = elapsed
+        self._interval_max_in_flight = self.in_flight
+        if len(self.in_flight_samples) > MAX_SAMPLES:
+            self.in_flight_samples = [
+                [s2[0], max(s1[1], s2[1])] for s1, s2 in zip(self.in_flight_samples[::2], self.in_flight_samples[1::2])
+            ]
+            self.sample_interval *= 2
+
+    def record_rate_limit_wait(self, wait_time: float) -> None:
+        if wait_time <= 0:
+            return
+        with self._lock:
+            self.num_rate_limit_waits += 1
+            self.rate_limit_wait_time += wait_time
+
+    def request_started(self, data: Dict, attempt: int = 0) -> None:
+        """
+        Record an HTTP request about to be sent with its payload, as the given attempt (0 for the first one)
+        """
+        documents = data.get("documents", [])
+        num_characters = sum(len(str(document.get("text", ""))) for document in documents)
+        with self._lock:
+            self.in_flight += 1
+            self.num_documents += len(documents)
+            self.num_characters += num_characters
+            self.num_retries += int(attempt > 0)
+            self._sample_in_flight()
+
+    def request_finished(self, status: Union[int, AnyStr], latency: float) -> None:
+        """
+        Record the end of an HTTP request with its latency in seconds, and its status code or exception name
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.status_counts[str(status)] += 1
+            self.request_latency.add(latency)
+            self._sample_in_flight()
+
+    @contextmanager
+    def track_request(self, data: Dict, attempt: int = 0) -> Iterator[Dict]:
+        """
+        Context manager around an HTTP request, yielding a dictionary whose "status" key is to be set
+        to the response status code. If an exception is raised, its name is recorded as status instead.
+        """
+        self.request_started(data, attempt)
+        start = perf_counter()
+        request = {"status": None}
+        try:
+            yield request
+        except BaseException as e:
+            request["status"] = type(e).__name__
+            raise
+        finally:
+            self.request_finished(request["status"], perf_counter() - start)
+
+    def record_rows(self, num_rows: int, num_failed_rows: int = 0, num_resumed_rows: int = 0) -> None:
+        """
+        Record the final outcome of input rows processed by api_parallelizer, after all attempts and segments:
+        failed rows are rows with an error in the output, resumed rows are rows read from a checkpoint
+        """
+        with self._lock:
+            self.num_rows += int(num_rows)
+            self.num_failed_rows += int(num_failed_rows)
+            self.num_resumed_rows += int(num_resumed_rows)
+
+    def record_call(self, latency: float, num_rows: int = 1) -> None:
+        """
+        Record a row or batch sent by api_parallelizer, and log progress at regular intervals.
+        Rows sent include segments and rows sent again after a transient error.
+        """
+        with self._lock:
+            self.call_latency.add(latency)
+            self.num_sent_rows += num_rows
+            elapsed = self._elapsed()
+            if elapsed - self._last_progress_log_time < self.progress_log_interval:
+                return
+            self._last_progress_log_time = elapsed
+            num_sent_rows = self.num_sent_rows
+            num_done_rows = self.num_rows
+        rows_per_second = num_sent_rows / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            "Progress: {} rows sent, {} rows done so far, {:.1f} rows/s sent".format(
+                num_sent_rows, num_done_rows, rows_per_second
+            )
+        )
+
+    def report(self) -> Dict:
+        """
+        Summarize all metrics in a JSON-serializable dictionary
+        """
+        with self._lock:
+            duration = self._elapsed()
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": round(duration, 3),
+                "rows": {
+                    "completed": self.num_rows,
+                    "failed": self.num_failed_rows,
+                    "resumed": self.num_resumed_rows,
+                    "sent": self.num_sent_rows,
+                    "rows_per_second": round(self.num_rows / duration, 3) if duration > 0 else None,
+                },
+                "calls": self.call_latency.to_dict(),
+                "requests": {
+                    "retries": self.num_retries,
+                    "documents": self.num_documents,
+                    "characters": self.num_characters,
+                    "status_counts": dict(self.status_counts),
+                    "latency": self.request_latency.to_dict(),
+                },
+                "rate_limit": {
+                    "waits": self.num_rate_limit_waits,
+                    "wait_seconds": round(self.rate_limit_wait_time, 3),
+                },
+                "concurrency": {
+                    "max_in_flight": self.max_in_flight,
+                    "sample_interval_seconds": self.sample_interval,
+                    "in_flight_samples": list(self.in_flight_samples),
+                },
+            }
+
+    def log_summary(self) -> Dict:
+        report = self.report()
+        latency = report["requests"]["latency"]
+        logging.info(
+            "API telemetry: {} requests ({} retries) in {:.2f} seconds, {:.1f} rows/s, latency p50 {} ms, p99 {} ms, "
+            "{:.2f} seconds waiting for the rate limit, status counts {}".format(
+                latency["count"],
+                report["requests"]["retries"],
+                report["duration_seconds"],
+                report["rows"]["rows_per_second"] or 0.0,
+                latency["p50_ms"],
+                latency["p99_ms"],
+                report["rate_limit"]["wait_seconds"],
+                report["requests"]["status_counts"],
+            )
+        )
+        return report
@@ -3,15 +3,89 @@
 
 import logging
 import os
+import gzip
+import asyncio
 import requests
+from time import sleep
 import json
-from typing import Dict, List, Union, NamedTuple
+from typing import AnyStr, Dict, List, Union, NamedTuple, Tuple, Optional
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+
+from plugin_io_utils import ParallelEngineEnum
+from api_response_cache import APIResponseCache
+from api_rate_limiter import TokenBucketRateLimiter, parse_retry_after, compute_backoff
+from api_shared_rate_limiter import SharedTokenBucketRateLimiter
+from api_endpoint_pool import APIEndpoint, EndpointPool
+from api_concurrency_controller import AIMDConcurrencyController
+from api_telemetry import APITelemetry
+from azure_nlp_api_segmentation import split_row, merge_segment_responses
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # ==============================================================================
 # CONSTANT DEFINITION
 # ==============================================================================
 
 API_EXCEPTIONS = requests.RequestException
+TRANSIENT_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+if aiohttp is not None:
+    API_EXCEPTIONS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError)
+    TRANSIENT_EXCEPTIONS = TRANSIENT_EXCEPTIONS + (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+DEFAULT_POOL_SIZE = 4
+DEFAULT_ASYNC_CONCURRENCY = 200
+DEFAULT_API_QUOTA_RATE_LIMIT = 300
+DEFAULT_API_QUOTA_PERIOD = 60
+DEFAULT_MAX_ATTEMPTS = 5
+# Error codes of documents or whole requests which may succeed if sent again later: throttling, server errors
+# and timeouts, as well as transient exceptions raised after all retries of a request have failed.
+# Other errors, such as invalid documents or unsupported languages, are permanent.
+TRANSIENT_API_ERROR_CODES = {
+    "429",
+    "500",
+    "502",
+    "503",
+    "504",
+    "TooManyRequests",
+    "RateLimitExceeded",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "GatewayTimeout",
+    "Timeout",
+}
+TRANSIENT_EXCEPTION_NAMES = {
+    "ConnectionError",
+    "Timeout",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "ChunkedEncodingError",
+    "ClientConnectionError",
+    "ClientConnectorError",
+    "ClientOSError",
+    "ServerDisconnectedError",
+    "ServerTimeoutError",
+    "TimeoutError",
+}
+
+APILimits = namedtuple("APILimits", ["max_documents", "max_document_characters", "max_request_characters"])
+# Data limits of the Text Analytics API v3.0 per endpoint: number of documents per request,
+# characters per document, and characters per request, chosen so that the request size stays below 1 MB
+# even with 4-byte UTF-8 characters
+API_SERVICE_LIMITS = {
+    "languages": APILimits(max_documents=1000, max_document_characters=5120, max_request_characters=125000),
+    "sentiment": APILimits(max_documents=10, max_document_characters=5120, max_request_characters=125000),
+    "keyPhrases": APILimits(max_documents=10, max_document_characters=5120, max_request_characters=125000),
+    "entities/recognition/general": APILimits(
+        max_documents=5, max_document_characters=5120, max_request_characters=125000
+    ),
+    "entities/recognition/pii": APILimits(max_documents=5, max_document_characters=5120, max_request_characters=125000),
+}
 
 # ==============================================================================
 # CLASS AND FUNCTION DEFINITION
@@ -19,27 +93,349 @@ API_EXCEPTIONS = requests.RequestException
 
 
 class AzureNLPAPIWrapper:
+    """
+    Wrapper around the Azure Text Analytics REST API:
+    - load credentials from the API configuration preset or the environment
+    - share a keep-alive HTTP session whose connection pool is sized to the preset concurrency
+    - optionally compress request bodies with gzip and pre-warm connections
+    - with the asyncio engine, return awaitables from an aiohttp session instead of blocking
+    - optionally serve documents from a persistent response cache, sending only cache misses
+    - pace requests with a token bucket shared by all workers, back off on HTTP 429 for as long as
+      the Retry-After header says, and retry transient server and connection errors with jittered backoff
+    - spread requests across the endpoints of the preset, each with its own key and rate limit,
+      and move them away from endpoints which throttle or fail
+    - optionally share the quota of each endpoint with all other processes of the node using it
+    - record the latency, status, payload size and rate-limit wait of every HTTP request in a telemetry collector
+    """
+
     def __init__(self, api_configuration_preset):
         if not api_configuration_preset:
             raise ValueError("No Azure credentials provided, please enter an API configuration preset")
         self.api_key = str(api_configuration_preset.get("azure_api_key", ""))
         self.region = str(api_configuration_preset.get("azure_region", ""))
-        self.endpoint = "https://{}.api.cognitive.microsoft.com".format(self.region)
         if not self.api_key:
             self.api_key = os.environ["AZURE_TEXT_ANALYTICS_KEY"]
-        if not self.region:
-            self.endpoint = os.environ["AZURE_TEXT_ANALYTICS_ENDPOINT"]
-        self.headers = {
-            "Content-Type": "application/json",
-            "Ocp-Apim-Subscription-Key": self.api_key,
-        }
+        self.endpoint = build_endpoint_url(self.region)
+        self.headers = {"Content-Type": "application/json"}
         self.version = "v3.0"
         self.base_url = "{}/text/analytics/{}/".format(self.endpoint, self.version)
-        logging.info("Credentials loaded")
+        self.endpoint_pool = self._build_endpoint_pool(api_configuration_preset)
+        logging.info("Credentials loaded for {} endpoint(s)".format(len(self.endpoint_pool)))
+        self.pool_size = int(api_configuration_preset.get("parallel_workers") or DEFAULT_POOL_SIZE)
+        self.gzip_request = bool(api_configuration_preset.get("gzip_request", False))
+        self.parallel_engine = ParallelEngineEnum[api_configuration_preset.get("parallel_engine") or "THREADS"]
+        self.async_concurrency = int(api_configuration_preset.get("async_concurrency") or DEFAULT_ASYNC_CONCURRENCY)
+        if self.parallel_engine == ParallelEngineEnum.ASYNCIO and aiohttp is None:
+            raise ImportError("The asyncio engine requires the aiohttp package, please add it to the code environment")
+        self.async_session = None
+        self.async_session_loop = None
+        self.async_connection_counts = {"opened": 0, "reused": 0}
+        self.session = self._build_session()
+        self.max_attempts = DEFAULT_MAX_ATTEMPTS
+        self.telemetry = APITelemetry()
+        self.adaptive_concurrency = bool(api_configuration_preset.get("adaptive_concurrency", False))
+        self.cache = None
+        if api_configuration_preset.get("use_cache", False):
+            self.cache = APIResponseCache(
+                api_version=self.version,
+                cache_path=api_configuration_preset.get("cache_path"),
+                max_age_days=api_configuration_preset.get("cache_max_age_days"),
+                max_entries=api_configuration_preset.get("cache_max_entries"),
+            )
+        if api_configuration_preset.get("prewarm_connections", False):
+            self.prewarm_connections()
+
+    def _build_endpoint_pool(self, api_configuration_preset: Dict) -> EndpointPool:
+        """
+        Build the pool of the main endpoint of the preset and its additional endpoints, each with its own rate limiter.
+        If the quota is shared, rate limiters of the same key and endpoint share their tokens across processes.
+        """
+        period = float(api_configuration_preset.get("api_quota_period") or DEFAULT_API_QUOTA_PERIOD)
+        rate_limit = int(api_configuration_preset.get("api_quota_rate_limit") or DEFAULT_API_QUOTA_RATE_LIMIT)
+        shared_quota = bool(api_configuration_preset.get("shared_quota", False))
+        endpoint_configs = [{"azure_api_key": self.api_key, "azure_region": self.region}]
+        endpoint_configs += api_configuration_preset.get("additional_endpoints") or []
+        endpoints = []
+        for endpoint_config in endpoint_configs:
+            api_key = str(endpoint_config.get("azure_api_key") or "")
+            if not api_key:
+                raise ValueError("No Azure API key provided for an additional endpoint, please edit the preset")
+            endpoint_url = build_endpoint_url(str(endpoint_config.get("azure_region") or ""))
+            name = endpoint_url.split("://")[-1]
+            if name in [e.name for e in endpoints]:
+                name = "{} ({})".format(name, len(endpoints) + 1)
+            endpoint_rate_limit = int(endpoint_config.get("api_quota_rate_limit") or rate_limit)
+            if shared_quota:
+                rate_limiter = SharedTokenBucketRateLimiter(
+                    rate_limit=endpoint_rate_limit,
+                    period=period,
+                    quota_key="{} {}".format(endpoint_url, api_key),
+                    store_path=api_configuration_preset.get("quota_store_path"),
+                )
+            else:
+                rate_limiter = TokenBucketRateLimiter(rate_limit=endpoint_rate_limit, period=period)
+            endpoints.append(
+                APIEndpoint(
+                    name=name,
+                    base_url="{}/text/analytics/{}/".format(endpoint_url, self.version),
+                    headers={"Ocp-Apim-Subscription-Key": api_key},
+                    rate_limiter=rate_limiter,
+                )
+            )
+        return EndpointPool(endpoints)
+
+    def build_concurrency_controller(
+        self, batch_size: int, max_concurrency: int = None
+    ) -> Optional[AIMDConcurrencyController]:
+        """
+        Build an adaptive controller of concurrency and batch size if enabled in the preset, bounded by
+        the concurrency of the engine, the given maximum concurrency if any, and the given batch size,
+        and watching the throttling of all endpoints of this wrapper
+        """
+        if not self.adaptive_concurrency:
+            return None
+        engine_concurrency = self.pool_size
+        if self.parallel_engine == ParallelEngineEnum.ASYNCIO:
+            engine_concurrency = self.async_concurrency
+        max_concurrency = min(engine_concurrency, max_concurrency or engine_concurrency)
+        return AIMDConcurrencyController(
+            initial_concurrency=1,
+            max_concurrency=max_concurrency,
+            initial_batch_size=batch_size,
+            max_batch_size=batch_size,
+            throttle_counter=self.endpoint_pool,
+        )
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=len(self.endpoint_pool), pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def prewarm_connections(self) -> None:
+        """
+        Open as many connections as the pool size in parallel, spread across endpoints,
+        so that the first batches reuse them
+        """
+        logging.info("Pre-warming {} connections to {} endpoint(s)...".format(self.pool_size, len(self.endpoint_pool)))
+        with ThreadPoolExecutor(max_workers=self.pool_size) as pool:
+            responses = list(pool.map(self._head_endpoint, range(self.pool_size)))
+        logging.info("Pre-warming connections: {}/{} succeeded.".format(sum(responses), self.pool_size))
+
+    def _head_endpoint(self, index: int) -> bool:
+        endpoint = self.endpoint_pool.endpoints[index % len(self.endpoint_pool)]
+        try:
+            self.session.head(endpoint.base_url, headers=endpoint.headers, timeout=10)
+            return True
+        except API_EXCEPTIONS as e:
+            logging.warning("Failed to pre-warm connection: {}".format(e))
+            return False
+
+    def connection_stats(self) -> Dict:
+        """
+        Count connections opened and requests which reused an open connection, over the session pool
+        of the threads engine and the aiohttp sessions of the asyncio engine
+        """
+        num_connections = self.async_connection_counts["opened"]
+        num_requests = self.async_connection_counts["opened"] + self.async_connection_counts["reused"]
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    num_connections += pool.num_connections
+                    num_requests += pool.num_requests
+        return {"opened": num_connections, "reused": max(num_requests - num_connections, 0)}
+
+    def log_connection_stats(self) -> Dict:
+        stats = self.connection_stats()
+        logging.info("HTTP connections: {} opened, {} reused.".format(stats["opened"], stats["reused"]))
+        return stats
+
+    def build_run_report(self) -> Dict:
+        """
+        Summarize the telemetry of all requests sent through this wrapper, with connection reuse statistics
+        and the throughput of each endpoint
+        """
+        report = self.telemetry.report()
+        report["connections"] = self.connection_stats()
+        report["endpoints"] = self.endpoint_pool.stats()
+        report["parallel_engine"] = self.parallel_engine.value
+        return report
+
+    def _get_async_session(self) -> "aiohttp.ClientSession":
+        """
+        Return an aiohttp session bound to the running event loop, creating it on first use
+        """
+        loop = asyncio.get_event_loop()
+        if self.async_session is None or self.async_session.closed or self.async_session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.async_concurrency)
+            self.async_session = aiohttp.ClientSession(
+                headers=self.headers, connector=connector, trace_configs=[self._build_async_trace_config()]
+            )
+            self.async_session_loop = loop
+        return self.async_session
+
+    def _build_async_trace_config(self) -> "aiohttp.TraceConfig":
+        """
+        Count connections opened and reused by aiohttp sessions, as aiohttp connectors do not keep these statistics
+        """
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, trace_config_ctx, params):
+            self.async_connection_counts["opened"] += 1
+
+        async def on_connection_reuseconn(session, trace_config_ctx, params):
+            self.async_connection_counts["reused"] += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def close(self) -> None:
+        self.session.close()
+        self.endpoint_pool.close()
+        loop = self.async_session_loop
+        if self.async_session is not None and not self.async_session.closed and not loop.is_closed():
+            loop.run_until_complete(self.async_session.close())
+        if self.cache is not None:
+            self.cache.close()
+
+    def _read_cache(self, service: str, data: Dict) -> Tuple[List[Dict], Dict]:
+        """
+        Split request documents between cached responses and a request payload with only cache misses
+        """
+        if self.cache is None:
+            return ([], data)
+        documents = data.get("documents", [])
+        keys = [self.cache.compute_key(service, document) for document in documents]
+        cached_responses = self.cache.get_many(keys)
+        cached_documents = [
+            {**cached_responses[key], "id": document.get("id")}
+            for key, document in zip(keys, documents)
+            if key in cached_responses
+        ]
+        data = {**data, "documents": [d for key, d in zip(keys, documents) if key not in cached_responses]}
+        return (cached_documents, data)
+
+    def _write_cache(self, service: str, data: Dict, response: Dict, cached_documents: List[Dict]) -> Dict:
+        """
+        Store successful documents of a response in the cache and merge back the cached documents
+        """
+        if self.cache is None or not isinstance(response, dict):
+            return response
+        documents_by_id = {str(document.get("id")): document for document in data.get("documents", [])}
+        self.cache.set_many(
+            [
+                (
+                    self.cache.compute_key(service, documents_by_id[str(r.get("id"))]),
+                    {k: v for k, v in r.items() if k != "id"},
+                )
+                for r in response.get("documents", [])
+                if str(r.get("id")) in documents_by_id
+            ]
+        )
+        if len(cached_documents) == 0:
+            return response
+        if "error" in response and "documents" not in response:
+            # case when the whole batch fails with a single error key: only sent documents have failed
+            response = {"errors": [{"id": d.get("id"), "error": response["error"]} for d in data.get("documents", [])]}
+        return {**response, "documents": response.get("documents", []) + cached_documents}
+
+    def _compute_retry_delay(self, attempt: int, status_code: int, headers: Dict, endpoint: APIEndpoint) -> float:
+        """
+        Return the delay before retrying a request, or -1 if the response should not be retried.
+        On HTTP 429, all workers are paused on the endpoint for the delay requested by the API,
+        and the request is retried at once on the endpoint which can serve it the soonest.
+        """
+        if attempt >= self.max_attempts - 1:
+            return -1
+        if status_code == 429:
+            retry_after = parse_retry_after(headers)
+            if retry_after is None:
+                retry_after = compute_backoff(attempt)
+            logging.warning(
+                "API rate limit exceeded on {}, pausing its requests for {:.1f} seconds".format(
+                    endpoint.name, retry_after
+                )
+            )
+            endpoint.rate_limiter.pause(retry_after)
+            return 0
+        if status_code >= 500:
+            delay = compute_backoff(attempt)
+            logging.warning("API server error {}, retrying in {:.1f} seconds".format(status_code, delay))
+            return delay
+        return -1
+
+    def _compute_exception_delay(self, attempt: int, exception: Exception) -> float:
+        if attempt >= self.max_attempts - 1:
+            raise exception
+        delay = compute_backoff(attempt)
+        logging.warning("API connection error: {}, retrying in {:.1f} seconds".format(exception, delay))
+        return delay
+
+    def _build_request_kwargs(self, data: Dict, endpoint: APIEndpoint) -> Dict:
+        if self.gzip_request:
+            return {
+                "data": gzip.compress(json.dumps(data).encode("utf-8")),
+                "headers": {**endpoint.headers, "Content-Encoding": "gzip"},
+            }
+        return {"json": data, "headers": endpoint.headers}
+
+    def _send(self, service: str, data: Dict) -> Dict:
+        num_documents = len(data.get("documents", []))
+        for attempt in range(self.max_attempts):
+            try:
+                with self.endpoint_pool.track_request(num_documents) as endpoint_request:
+                    endpoint = endpoint_request["endpoint"]
+                    self.telemetry.record_rate_limit_wait(endpoint.rate_limiter.acquire())
+                    with self.telemetry.track_request(data, attempt) as request:
+                        response = self.session.post(
+                            endpoint.base_url + service, **self._build_request_kwargs(data, endpoint)
+                        )
+                        request["status"] = endpoint_request["status"] = response.status_code
+            except TRANSIENT_EXCEPTIONS as e:
+                sleep(self._compute_exception_delay(attempt, e))
+                continue
+            delay = self._compute_retry_delay(attempt, response.status_code, response.headers, endpoint)
+            if delay < 0:
+                return response.json()
+            sleep(delay)
+
+    async def _send_async(self, service: str, data: Dict) -> Dict:
+        session = self._get_async_session()
+        num_documents = len(data.get("documents", []))
+        for attempt in range(self.max_attempts):
+            try:
+                with self.endpoint_pool.track_request(num_documents) as endpoint_request:
+                    endpoint = endpoint_request["endpoint"]
+                    self.telemetry.record_rate_limit_wait(await endpoint.rate_limiter.acquire_async())
+                    with self.telemetry.track_request(data, attempt) as request:
+                        async with session.post(
+                            endpoint.base_url + service, **self._build_request_kwargs(data, endpoint)
+                        ) as response:
+                            request["status"] = endpoint_request["status"] = response.status
+                            delay = self._compute_retry_delay(attempt, response.status, response.headers, endpoint)
+                            if delay < 0:
+                                return await response.json(content_type=None)
+            except TRANSIENT_EXCEPTIONS as e:
+                delay = self._compute_exception_delay(attempt, e)
+            await asyncio.sleep(delay)
+
+    async def _post_async(self, service, data, cached_documents=None):
+        response = await self._send_async(service, data)
+        return self._write_cache(service, data, response, cached_documents or [])
 
     def _post(self, service, data):
-        response = requests.post(self.base_url + service, json=data, headers=self.headers)
-        return response.json()
+        cached_documents, data = self._read_cache(service, data)
+        if len(cached_documents) != 0 and len(data.get("documents", [])) == 0:
+            return {"documents": cached_documents, "errors": []}
+        if self.parallel_engine == ParallelEngineEnum.ASYNCIO:
+            return self._post_async(service, data, cached_documents)
+        response = self._send(service, data)
+        return self._write_cache(service, data, response, cached_documents)
 
     def detect_language(self, data):
         return self._post("languages", data)
@@ -57,31 +453,107 @@ class AzureNLPAPIWrapper:
         return self._post("keyPhrases", data)
 
 
+def build_endpoint_url(region: AnyStr) -> AnyStr:
+    """
+    Build the URL of an Azure Text Analytics endpoint from a region, e.g. "eastus", or return the endpoint as is
+    if a full URL is given, e.g. for resources with a custom subdomain. If empty, read it from the environment.
+    """
+    if not region:
+        return os.environ["AZURE_TEXT_ANALYTICS_ENDPOINT"].rstrip("/")
+    if "://" in region:
+        return region.rstrip("/")
+    return "https://{}.api.cognitive.microsoft.com".format(region)
+
+
+def count_text_characters(row: Dict, text_column: AnyStr) -> int:
+    """
+    Count the characters of a row's text as sent to the API
+    """
+    return len(str(row.get(text_column, "")).strip())
+
+
+def build_batch_kwargs(service: AnyStr, batch_size: int, text_column: AnyStr) -> Dict:
+    """
+    Build the batch keyword arguments of api_parallelizer for a given service,
+    so that each request is filled up to the service limits without going over them,
+    and documents longer than the limit are split into segments whose results are merged back
+    """
+    limits = API_SERVICE_LIMITS[service]
+    batch_kwargs = {
+        "api_support_batch": True,
+        "batch_size": min(int(batch_size or limits.max_documents), limits.max_documents),
+        "batch_api_response_parser": batch_api_response_parser,
+        "max_batch_weight": limits.max_request_characters,
+        "row_weight_function": partial(count_text_characters, text_column=text_column),
+        "transient_error_function": is_transient_api_error,
+        "split_function": partial(split_row, text_column=text_column, max_characters=limits.max_document_characters),
+        "merge_function": partial(merge_segment_responses, service=service, text_column=text_column),
+    }
+    return batch_kwargs
+
+
+def is_transient_api_error(error_type: AnyStr) -> bool:
+    """
+    Tell if an error type, as written by batch_api_response_parser or api_parallelizer, is transient,
+    i.e. if the documents which failed with it may succeed if sent again later
+    """
+    error_type = str(error_type)
+    return error_type in TRANSIENT_API_ERROR_CODES or error_type.rsplit(".", 1)[-1] in TRANSIENT_EXCEPTION_NAMES
+
+
+def index_by_id(items: List[Dict]) -> Dict[AnyStr, Dict]:
+    """
+    Index a list of API documents or errors by their id, keeping the first occurrence of each id
+    """
+    index = {}
+    for item in items:
+        index.setdefault(str(item.get("id", "")), item)
+    return index
+
+
+def parse_api_error(raw_error: Dict) -> Tuple[AnyStr, AnyStr, AnyStr]:
+    """
+    Extract the message, type and raw representation of an API error,
+    from its inner error if any, whose key is "innererror" or "innerError" depending on the API version
+    """
+    error_dict = raw_error.get("error", {})
+    for inner_error_key in ["innererror", "innerError"]:
+        if inner_error_key in error_dict:
+            error_dict = error_dict.get(inner_error_key, {})
+            break
+    return (error_dict.get("message", str(raw_error)), error_dict.get("code", "Undefined API error"), str(raw_error))
+
+
 def batch_api_response_parser(batch: List[Dict], response: Union[Dict, List], api_column_names: NamedTuple) -> Dict:
     """
     Function to parse API results in the batch case. Needed for api_parallelizer.api_call_batch
     when APIs result need specific parsing logic (every API may be different).
+    Documents and errors are indexed by id once per response, and looked up from each batch position,
+    so that parsing is linear in the batch size whatever the order or gaps of ids in the response.
     """
-    results = response.get("documents", [])
-    errors = response.get("errors", [])
-    for i in range(len(batch)):
+    results_by_id = index_by_id(response.get("documents", []))
+    errors_by_id = index_by_id(response.get("errors", []))
+    batch_error = None
+    if "error" in response and "documents" not in response:
+        # case when the whole batch fails with a single error key
+        logging.warning(str(response))
+        batch_error = parse_api_error(response)
+    for i, row in enumerate(batch):
         for k in api_column_names:
-            batch[i][k] = ""
-        result = [r for r in results if str(r.get("id", "")) == str(i)]
-        error = [r for r in errors if str(r.get("id", "")) == str(i)]
-        if "error" in response and "documents" not in response:
-            # case when the whole batch fails with a single error key
-            error = [response]
-        if len(result) != 0:
-            # result must be json serializable
-            batch[i][api_column_names.response] = json.dumps(result[0])
-        if len(error) != 0:
-            raw_error = error[0]
+            row[k] = ""
+        document_id = str(i)
+        result = results_by_id.get(document_id)
+        if result is not None:
+            # result is kept decoded for the formatters, and serialized to JSON only when written
+            row[api_column_names.response] = result
+        error = batch_error
+        if error is None and document_id in errors_by_id:
+            raw_error = errors_by_id[document_id]
             logging.warning(str(raw_error))
-            error_dict = raw_error.get("error", {})
-            if "innererror" in error_dict:
-                error_dict = error_dict.get("innererror", {})
-            batch[i][api_column_names.error_message] = error_dict.get("message", str(raw_error))
-            batch[i][api_column_names.error_type] = error_dict.get("code", "Undefined API error")
-            batch[i][api_column_names.error_raw] = str(raw_error)
+            error = parse_api_error(raw_error)
+        if error is not None:
+            error_message, error_type, error_raw = error
+            row[api_column_names.error_message] = error_message
+            row[api_column_names.error_type] = error_type
+            row[api_column_names.error_raw] = error_raw
     return batch
@@ -2,17 +2,23 @@
 """Module with classes to format results from the Azure Cognitive Services Text Analytics API"""
 
 import logging
-from typing import AnyStr, Dict, List
+import multiprocessing
+from math import ceil
+from functools import partial
+from typing import AnyStr, Dict, List, Callable, Optional, Tuple
 from enum import Enum
+from collections import OrderedDict
 
 import pandas as pd
 
 from plugin_io_utils import (
     API_COLUMN_NAMES_DESCRIPTION_DICT,
+    STRING_DTYPE,
     ErrorHandlingEnum,
     build_unique_column_names,
     generate_unique,
     safe_json_loads,
+    serialize_json_column,
     move_api_columns_to_end,
 )
 
@@ -21,6 +27,20 @@ from plugin_io_utils import (
 # CONSTANT DEFINITION
 # ==============================================================================
 
+MIN_ROWS_PER_PROCESS = 1000  # Below this number of rows, sending them to another process costs more than formatting
+DEFAULT_REDACTION_MASK = "[REDACTED]"
+# Columns of the long format of entities, with one row per entity, after the row id column
+ENTITY_LONG_COLUMN_DESCRIPTION_DICT = OrderedDict(
+    [
+        ("category", "Category of the entity"),
+        ("subcategory", "Subcategory of the entity, if any"),
+        ("text", "Text of the entity"),
+        ("offset", "Offset of the entity in the text"),
+        ("length", "Length of the entity in the text"),
+        ("confidence_score", "Confidence score of the API from 0 to 1"),
+    ]
+)
+
 
 class EntityTypeEnum(Enum):
     DateTime = "Date and Time entities"
@@ -38,17 +58,137 @@ class EntityTypeEnum(Enum):
     URL = "URL"
 
 
+class RedactionModeEnum(Enum):
+    REMOVE = "Remove PII from the text"
+    MASK = "Replace PII with a fixed mask"
+    CATEGORY = "Replace PII with its category, e.g. [Person]"
+
+
 # ==============================================================================
 # CLASS AND FUNCTION DEFINITION
 # ==============================================================================
 
 
+class FormattingProcessPool:
+    """
+    Pool of processes to format API results on several cores, shared by all formatters of a recipe.
+    Processes are forked when the pool is built, so it should be built before starting any thread.
+    """
+
+    def __init__(self, num_processes: int):
+        self.num_processes = int(num_processes)
+        if self.num_processes < 2:
+            raise ValueError("A formatting process pool requires at least 2 processes")
+        self._pool = multiprocessing.Pool(processes=self.num_processes)
+        logging.info("Formatting API results in {} processes".format(self.num_processes))
+
+    def map(self, func: Callable, items: List) -> List:
+        """
+        Apply a picklable function to each item in the pool, and return results in the order of items
+        """
+        return self._pool.map(func, items, chunksize=1)
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+
+def merge_entity_spans(entities: List[Dict], text_length: int) -> List[Tuple[int, int, AnyStr]]:
+    """
+    Sort the (start, end, category) spans of entities within a text, and merge overlapping spans into one,
+    with the category of the span starting first (the longest one if several start at the same offset)
+    """
+    spans = []
+    for e in entities:
+        if e.get("offset") is None or e.get("length") is None:
+            continue
+        start = min(max(int(e["offset"]), 0), text_length)
+        end = min(start + max(int(e["length"]), 0), text_length)
+        if end > start:
+            spans.append((start, end, str(e.get("category", ""))))
+    spans.sort(key=lambda span: (span[0], -span[1]))
+    merged_spans = []
+    for start, end, category in spans:
+        if len(merged_spans) != 0 and start < merged_spans[-1][1]:
+            previous_start, previous_end, previous_category = merged_spans[-1]
+            merged_spans[-1] = (previous_start, max(previous_end, end), previous_category)
+        else:
+            merged_spans.append((start, end, category))
+    return merged_spans
+
+
+def redact_text(
+    text: AnyStr,
+    entities: List[Dict],
+    redaction_mode: RedactionModeEnum = RedactionModeEnum.REMOVE,
+    redaction_mask: AnyStr = DEFAULT_REDACTION_MASK,
+) -> AnyStr:
+    """
+    Redact the spans of entities from a text in a single pass, after merging overlapping spans:
+    - REMOVE: drop the characters of each span
+    - MASK: replace each span with a fixed mask
+    - CATEGORY: replace each span with its category in brackets, e.g. [PhoneNumber]
+    """
+    pieces = []
+    position = 0
+    for start, end, category in merge_entity_spans(entities, len(text)):
+        pieces.append(text[position:start])
+        if redaction_mode == RedactionModeEnum.MASK:
+            pieces.append(redaction_mask)
+        elif redaction_mode == RedactionModeEnum.CATEGORY:
+            pieces.append("[{}]".format(category))
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def build_entity_long_df(row_ids: List[int], entities_list: List[List[Dict]], row_id_column: AnyStr) -> pd.DataFrame:
+    """
+    Build a dataframe of entities in long format with one row per entity, from the entities of each input row.
+    Columns are built one at a time with compact explicit types, so that the dataframe is typed even when empty.
+    """
+    entities = [e for row_entities in entities_list for e in row_entities]
+    long_columns = OrderedDict()
+    long_columns[row_id_column] = pd.Series(
+        [row_id for row_id, row_entities in zip(row_ids, entities_list) for _ in row_entities], dtype="int64"
+    )
+    long_columns["category"] = pd.Series([str(e.get("category", "")) for e in entities], dtype="category")
+    long_columns["subcategory"] = pd.Series([str(e.get("subcategory") or "") for e in entities], dtype="category")
+    long_columns["text"] = pd.Series([str(e.get("text", "")) for e in entities], dtype=STRING_DTYPE)
+    long_columns["offset"] = pd.Series([int(e.get("offset", 0)) for e in entities], dtype="int32")
+    long_columns["length"] = pd.Series([int(e.get("length", 0)) for e in entities], dtype="int32")
+    long_columns["confidence_score"] = pd.Series(
+        [float(e.get("confidenceScore", 0)) for e in entities], dtype="float32"
+    )
+    return pd.DataFrame(long_columns)
+
+
+def build_formatting_process_pool(num_processes: int) -> Optional[FormattingProcessPool]:
+    """
+    Build a formatting process pool, or return None to format results in the current process
+    """
+    if int(num_processes or 1) < 2:
+        return None
+    return FormattingProcessPool(num_processes)
+
+
+def compute_output_columns(api_formatter: "GenericAPIFormatter", df: pd.DataFrame) -> Dict[AnyStr, List]:
+    """
+    Module-level function to compute the output columns of a formatter in a process of a FormattingProcessPool
+    """
+    return api_formatter.compute_output_columns(df)
+
+
 class GenericAPIFormatter:
     """
     Geric Formatter class for API responses:
     - initialize with generic parameters
     - compute generic column descriptions
-    - apply format_row to dataframe
+    - declare the dtype of output columns, e.g. float32 scores, categorical labels or nullable strings
+    - decode the response column in bulk and add the columns computed by format_columns to the dataframe
+    - serialize the response column to JSON, as responses may be passed already decoded by the API parser
+    - optionally split the dataframe in a pool of processes, sending them only the input columns needed
+    - format_row gives the same result row by row
     """
 
     def __init__(
@@ -64,13 +204,64 @@ class GenericAPIFormatter:
         self.column_description_dict = {
             v: API_COLUMN_NAMES_DESCRIPTION_DICT[k] for k, v in self.api_column_names._asdict().items()
         }
+        # Output columns without a declared dtype are inferred by pandas
+        self.column_dtype_dict = {v: STRING_DTYPE for v in self.api_column_names}
+        self.formatting_input_columns = [self.api_column_names.response]  # Columns read by format_columns
 
     def format_row(self, row: Dict) -> Dict:
         return row
 
-    def format_df(self, df: pd.DataFrame) -> pd.DataFrame:
+    def decode_responses(self, df: pd.DataFrame) -> List[Dict]:
+        return [safe_json_loads(r, self.error_handling) for r in df[self.api_column_names.response]]
+
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        """
+        Compute output columns from the decoded responses of a dataframe, column by column
+        """
+        return {}
+
+    def compute_output_columns(self, df: pd.DataFrame) -> Dict[AnyStr, List]:
+        """
+        Compute the output columns of a dataframe, including the response column serialized to JSON
+        """
+        responses = self.decode_responses(df)
+        output_columns = self.format_columns(df, responses)
+        output_columns[self.api_column_names.response] = serialize_json_column(df[self.api_column_names.response])
+        return output_columns
+
+    def compute_output_columns_in_processes(
+        self, df: pd.DataFrame, process_pool: FormattingProcessPool
+    ) -> Dict[AnyStr, List]:
+        """
+        Split the input columns of a dataframe into one slice per process, compute the output columns of each slice
+        in the pool, and concatenate them in order
+        """
+        num_slices = min(process_pool.num_processes, len(df.index) // MIN_ROWS_PER_PROCESS)
+        slice_size = int(ceil(len(df.index) / float(num_slices)))
+        input_df = df[[c for c in self.formatting_input_columns if c in df.columns]]
+        df_slices = [input_df.iloc[i : i + slice_size] for i in range(0, len(input_df.index), slice_size)]
+        slice_output_columns = process_pool.map(partial(compute_output_columns, self), df_slices)
+        return {
+            column_name: [value for output_columns in slice_output_columns for value in output_columns[column_name]]
+            for column_name in slice_output_columns[0]
+        }
+
+    def build_typed_columns(self, output_columns: Dict[AnyStr, List], index: pd.Index) -> Dict[AnyStr, pd.Series]:
+        """
+        Build each output column directly in its declared dtype
+        """
+        return {
+            column_name: pd.Series(values, index=index, dtype=self.column_dtype_dict.get(column_name))
+            for column_name, values in output_columns.items()
+        }
+
+    def format_df(self, df: pd.DataFrame, process_pool: Optional[FormattingProcessPool] = None) -> pd.DataFrame:
         logging.info("Formatting API results...")
-        df = df.apply(func=self.format_row, axis=1)
+        if process_pool is not None and len(df.index) >= 2 * MIN_ROWS_PER_PROCESS:
+            output_columns = self.compute_output_columns_in_processes(df, process_pool)
+        else:
+            output_columns = self.compute_output_columns(df)
+        df = df.assign(**self.build_typed_columns(output_columns, df.index))
         df = move_api_columns_to_end(df, self.api_column_names, self.error_handling)
         logging.info("Formatting API results: Done.")
         return df
@@ -94,6 +285,9 @@ class LanguageDetectionAPIFormatter(GenericAPIFormatter):
         self.language_name_column = generate_unique("language_name", input_df.keys(), self.column_prefix)
         self.language_code_column = generate_unique("language_code", input_df.keys(), self.column_prefix)
         self.language_score_column = generate_unique("language_score", input_df.keys(), self.column_prefix)
+        self.column_dtype_dict[self.language_name_column] = "category"
+        self.column_dtype_dict[self.language_code_column] = "category"
+        self.column_dtype_dict[self.language_score_column] = "float32"
         self._compute_column_description()
 
     def _compute_column_description(self):
@@ -112,6 +306,16 @@ class LanguageDetectionAPIFormatter(GenericAPIFormatter):
             row[self.language_score_column] = float(language.get("confidenceScore"))
         return row
 
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        languages = [response.get("detectedLanguage", {}) for response in responses]
+        scores = [language.get("confidenceScore") for language in languages]
+        output_columns = {
+            self.language_name_column: [language.get("name", "") for language in languages],
+            self.language_code_column: [language.get("iso6391Name", "") for language in languages],
+            self.language_score_column: [float(score) if score is not None else None for score in scores],
+        }
+        return output_columns
+
 
 class SentimentAnalysisAPIFormatter(GenericAPIFormatter):
     """
@@ -133,6 +337,9 @@ class SentimentAnalysisAPIFormatter(GenericAPIFormatter):
             p: generate_unique("score_" + p.lower(), input_df.keys(), column_prefix)
             for p in ["positive", "neutral", "negative"]
         }
+        self.column_dtype_dict[self.sentiment_prediction_column] = "category"
+        for column_name in self.sentiment_score_column_dict.values():
+            self.column_dtype_dict[column_name] = "float32"
         self._compute_column_description()
 
     def _compute_column_description(self):
@@ -156,12 +363,22 @@ class SentimentAnalysisAPIFormatter(GenericAPIFormatter):
                 row[column_name] = round(score, 3)
         return row
 
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        output_columns = {self.sentiment_prediction_column: [response.get("sentiment", "") for response in responses]}
+        sentiment_scores = [response.get("confidenceScores", {}) for response in responses]
+        for prediction, column_name in self.sentiment_score_column_dict.items():
+            scores = [sentiment_score.get(prediction) for sentiment_score in sentiment_scores]
+            output_columns[column_name] = [round(score, 3) if score is not None else None for score in scores]
+        return output_columns
+
 
 class NamedEntityRecognitionAPIFormatter(GenericAPIFormatter):
     """
     Formatter class for Named Entity Recognition API responses:
     - make sure response is valid JSON
-    - expand results to multiple columns (one by entity type)
+    - expand results to multiple columns (one by entity type), unless wide_output is False
+    - optionally add the row id of each row, to join it with entities in long format
+    - format entities in long format, with one row per entity
     - compute column descriptions
     """
 
@@ -172,10 +389,22 @@ class NamedEntityRecognitionAPIFormatter(GenericAPIFormatter):
         minimum_score: float,
         column_prefix: AnyStr = "entity_api",
         error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG,
+        wide_output: bool = True,
+        row_id_output: bool = False,
     ):
         super().__init__(input_df, column_prefix, error_handling)
         self.entity_types = entity_types
         self.minimum_score = float(minimum_score)
+        self.wide_output = bool(wide_output)
+        self.row_id_output = bool(row_id_output)
+        self.entity_type_column_dict = {
+            n: generate_unique("entity_type_" + n.lower(), input_df.keys(), column_prefix)
+            for n in sorted([e.name for e in entity_types])
+        }
+        if not self.wide_output:
+            self.entity_type_column_dict = {}
+        self.row_id_column = generate_unique("row_id", input_df.keys(), column_prefix)
+        self.column_dtype_dict[self.row_id_column] = "int64"
         self._compute_column_description()
 
     def _compute_column_description(self):
@@ -184,6 +413,26 @@ class NamedEntityRecognitionAPIFormatter(GenericAPIFormatter):
             self.column_description_dict[entity_type_column] = "List of '{}' entities recognized by the API".format(
                 str(m.value)
             )
+        self.column_description_dict[self.row_id_column] = "Row number in the input dataset"
+        self.long_column_description_dict = OrderedDict([(self.row_id_column, "Row number in the input dataset")])
+        self.long_column_description_dict.update(ENTITY_LONG_COLUMN_DESCRIPTION_DICT)
+
+    def select_entities(self, response: Dict) -> List[Dict]:
+        selected_entity_types = {e.name for e in self.entity_types}
+        return [
+            e
+            for e in response.get("entities", [])
+            if e.get("category", "") in selected_entity_types
+            and float(e.get("confidenceScore", 0)) >= self.minimum_score
+        ]
+
+    def format_long_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Format the entities of selected types above the minimum score in long format, with one row per entity
+        and the index of the dataframe as row id
+        """
+        responses = self.decode_responses(df)
+        return build_entity_long_df(list(df.index), [self.select_entities(r) for r in responses], self.row_id_column)
 
     def format_row(self, row: Dict) -> Dict:
         raw_response = row[self.api_column_names.response]
@@ -198,8 +447,7 @@ class NamedEntityRecognitionAPIFormatter(GenericAPIFormatter):
         ]
         if len(discarded_entities) != 0:
             logging.info("Discarding {} entities below the minimum score threshold".format(len(discarded_entities)))
-        for n in selected_entity_types:
-            entity_type_column = generate_unique("entity_type_" + n.lower(), row.keys(), self.column_prefix)
+        for n, entity_type_column in self.entity_type_column_dict.items():
             row[entity_type_column] = [
                 e.get("text")
                 for e in entities
@@ -209,13 +457,34 @@ class NamedEntityRecognitionAPIFormatter(GenericAPIFormatter):
                 row[entity_type_column] = ""
         return row
 
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        output_columns = {column_name: [] for column_name in self.entity_type_column_dict.values()}
+        num_discarded_entities = 0
+        for response in responses:
+            entities_by_type = {n: [] for n in self.entity_type_column_dict}
+            for e in response.get("entities", []):
+                category = e.get("category", "")
+                if category in entities_by_type:
+                    if float(e.get("confidenceScore", 0)) >= self.minimum_score:
+                        entities_by_type[category].append(e.get("text"))
+                    else:
+                        num_discarded_entities += 1
+            for n, column_name in self.entity_type_column_dict.items():
+                output_columns[column_name].append(entities_by_type[n] if len(entities_by_type[n]) != 0 else "")
+        if num_discarded_entities != 0:
+            logging.info("Discarding {} entities below the minimum score threshold".format(num_discarded_entities))
+        if self.row_id_output:
+            output_columns[self.row_id_column] = list(df.index)
+        return output_columns
+
 
 class PIIExtractionAPIFormatter(GenericAPIFormatter):
     """
     Formatter class for PII Extraction API responses:
     - make sure response is valid JSON
     - extract list of PII data
-    - output a redacted version of the input column without PII
+    - output a redacted version of the input column, with PII removed or replaced by a mask or their category
+    - format PII in long format, with one row per PII entity
     - compute column descriptions
     """
 
@@ -226,19 +495,47 @@ class PIIExtractionAPIFormatter(GenericAPIFormatter):
         minimum_score: float,
         column_prefix: AnyStr = "pii_api",
         error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG,
+        redaction_mode: RedactionModeEnum = RedactionModeEnum.REMOVE,
+        redaction_mask: AnyStr = DEFAULT_REDACTION_MASK,
     ):
         super().__init__(input_df, column_prefix, error_handling)
         self.text_column = str(text_column)
         self.minimum_score = float(minimum_score)
+        self.redaction_mode = redaction_mode
+        self.redaction_mask = str(redaction_mask)
         self.pii_column_text = generate_unique("text_list", self.input_df.keys(), self.column_prefix)
         self.pii_column_raw = generate_unique("raw_list", self.input_df.keys(), self.column_prefix)
         self.pii_column_redacted = generate_unique("redacted", self.input_df.keys(), self.column_prefix)
+        self.row_id_column = generate_unique("row_id", self.input_df.keys(), self.column_prefix)
+        self.column_dtype_dict[self.pii_column_redacted] = STRING_DTYPE
+        self.formatting_input_columns.append(self.text_column)
         self._compute_column_description()
 
     def _compute_column_description(self):
         self.column_description_dict[self.pii_column_text] = "List of PII in text format"
         self.column_description_dict[self.pii_column_raw] = "List of PII in JSON format"
-        self.column_description_dict[self.pii_column_redacted] = "Redacted version of the input column without PII"
+        self.column_description_dict[self.pii_column_redacted] = "Redacted version of the input column: {}".format(
+            self.redaction_mode.value
+        )
+        self.long_column_description_dict = OrderedDict([(self.row_id_column, "Row number in the input dataset")])
+        self.long_column_description_dict.update(ENTITY_LONG_COLUMN_DESCRIPTION_DICT)
+
+    def select_entities(self, response: Dict) -> List[Dict]:
+        return [
+            e
+            for e in response.get("entities", [])
+            if e.get("text", "") != ""
+            and e.get("category", "") not in {"Organization", "DateTime", "Quantity"}
+            and float(e.get("confidenceScore", 0)) >= self.minimum_score
+        ]
+
+    def format_long_df(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Format PII entities above the minimum score in long format, with one row per entity
+        and the index of the dataframe as row id
+        """
+        responses = self.decode_responses(df)
+        return build_entity_long_df(list(df.index), [self.select_entities(r) for r in responses], self.row_id_column)
 
     def format_row(self, row: Dict) -> Dict:
         raw_response = row[self.api_column_names.response]
@@ -252,21 +549,43 @@ class PIIExtractionAPIFormatter(GenericAPIFormatter):
         discarded_entities = [e for e in entities if float(e.get("confidenceScore", 0)) < self.minimum_score]
         if len(discarded_entities) != 0:
             logging.info("Discarding {} entities below the minimum score threshold".format(len(discarded_entities)))
-        text_to_redact = str(row.get(self.text_column, ""))
         row[self.pii_column_redacted] = ""
         row[self.pii_column_text] = ""
         row[self.pii_column_raw] = ""
         if len(entities_filtered) != 0:
             row[self.pii_column_raw] = entities_filtered
             row[self.pii_column_text] = [e.get("text") for e in entities_filtered]
-            entities_reversed = sorted(entities_filtered, key=lambda x: int(x.get("offset", -1)), reverse=True)
-            for e in entities_reversed:
-                start = int(e.get("offset"))
-                end = start + int(e.get("length"))
-                text_to_redact = text_to_redact[:start] + "" + text_to_redact[end:]
-            row[self.pii_column_redacted] = text_to_redact
+            row[self.pii_column_redacted] = redact_text(
+                str(row.get(self.text_column, "")).strip(), entities_filtered, self.redaction_mode, self.redaction_mask
+            )
         return row
 
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        output_columns = {self.pii_column_redacted: [], self.pii_column_text: [], self.pii_column_raw: []}
+        texts = df[self.text_column] if self.text_column in df.columns else [""] * len(df.index)
+        num_discarded_entities = 0
+        for response, text in zip(responses, texts):
+            entities = [
+                e
+                for e in response.get("entities", [])
+                if e.get("text", "") != "" and e.get("category", "") not in {"Organization", "DateTime", "Quantity"}
+            ]
+            entities_filtered = [e for e in entities if float(e.get("confidenceScore", 0)) >= self.minimum_score]
+            num_discarded_entities += len(entities) - len(entities_filtered)
+            if len(entities_filtered) == 0:
+                output_columns[self.pii_column_redacted].append("")
+                output_columns[self.pii_column_text].append("")
+                output_columns[self.pii_column_raw].append("")
+                continue
+            output_columns[self.pii_column_redacted].append(
+                redact_text(str(text).strip(), entities_filtered, self.redaction_mode, self.redaction_mask)
+            )
+            output_columns[self.pii_column_text].append([e.get("text") for e in entities_filtered])
+            output_columns[self.pii_column_raw].append(entities_filtered)
+        if num_discarded_entities != 0:
+            logging.info("Discarding {} entities below the minimum score threshold".format(num_discarded_entities))
+        return output_columns
+
 
 class KeyPhraseExtractionAPIFormatter(GenericAPIFormatter):
     """
@@ -285,6 +604,11 @@ class KeyPhraseExtractionAPIFormatter(GenericAPIFormatter):
     ):
         super().__init__(input_df, column_prefix, error_handling)
         self.num_key_phrases = num_key_phrases
+        self.keyphrase_columns = [
+            generate_unique("keyphrase_" + str(n + 1), input_df.keys(), column_prefix) for n in range(num_key_phrases)
+        ]
+        for keyphrase_column in self.keyphrase_columns:
+            self.column_dtype_dict[keyphrase_column] = STRING_DTYPE
         self._compute_column_description()
 
     def _compute_column_description(self):
@@ -303,3 +627,11 @@ class KeyPhraseExtractionAPIFormatter(GenericAPIFormatter):
             else:
                 row[keyphrase_column] = ""
         return row
+
+    def format_columns(self, df: pd.DataFrame, responses: List[Dict]) -> Dict[AnyStr, List]:
+        key_phrases_list = [response.get("keyPhrases", []) for response in responses]
+        output_columns = {
+            keyphrase_column: [key_phrases[n] if len(key_phrases) > n else "" for key_phrases in key_phrases_list]
+            for n, keyphrase_column in enumerate(self.keyphrase_columns)
+        }
+        return output_columns
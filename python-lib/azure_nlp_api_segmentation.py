@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Module with functions to split long documents into segments within the API limits, and merge their results"""
+
+import re
+from collections import OrderedDict
+from itertools import zip_longest
+from typing import AnyStr, Dict, List, Pattern, Tuple
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+SEGMENT_OFFSET_KEY = "__segment_offset__"  # Offset of a segment in the text of its row
+# End of a sentence: final punctuation, optional closing quotes or brackets, then whitespace; or a line break
+SENTENCE_BOUNDARY_REGEX = re.compile(r"[.!?。！？]+[\"'”’)\]]*\s+|\n\s*")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def _find_last_boundary(regex: Pattern, text: AnyStr) -> int:
+    """
+    Return the end position of the last match of a regex in a text, or 0 if it does not match
+    """
+    end = 0
+    for match in regex.finditer(text):
+        end = match.end()
+    return end
+
+
+def split_text(text: AnyStr, max_characters: int) -> List[Tuple[int, AnyStr]]:
+    """
+    Split a text into contiguous segments of at most max_characters, each with its offset in the text.
+    Segments are cut after the last sentence boundary which fits, else after the last whitespace,
+    else at max_characters. Whitespace after a cut stays at the end of the preceding segment.
+    """
+    segments = []
+    start = 0
+    while len(text) - start > max_characters:
+        window = text[start : start + max_characters]
+        end = _find_last_boundary(SENTENCE_BOUNDARY_REGEX, window)
+        if end == 0:
+            end = _find_last_boundary(WHITESPACE_REGEX, window)
+        if end == 0:
+            end = max_characters
+        segments.append((start, text[start : start + end]))
+        start += end
+    segments.append((start, text[start:]))
+    return segments
+
+
+def split_row(row: Dict, text_column: AnyStr, max_characters: int) -> List[Dict]:
+    """
+    Split a row whose text is longer than max_characters into segment rows, with the offset of each segment
+    in the stripped text, as sent to the API. Rows within the limit are returned as is.
+    """
+    text = str(row.get(text_column, "")).strip()
+    if len(text) <= max_characters:
+        return [row]
+    return [
+        {**row, text_column: segment, SEGMENT_OFFSET_KEY: offset}
+        for offset, segment in split_text(text, max_characters)
+    ]
+
+
+def _shift_offsets(items: List[Dict], offset: int) -> List[Dict]:
+    return [{**item, "offset": int(item.get("offset", 0)) + offset} if "offset" in item else item for item in items]
+
+
+def _merge_language(responses: List[Dict], weights: List[int]) -> Dict:
+    """
+    Choose the language with the highest confidence score weighted by segment length
+    """
+    weighted_scores = OrderedDict()
+    languages = {}
+    for response, weight in zip(responses, weights):
+        language = response.get("detectedLanguage", {})
+        code = language.get("iso6391Name", "")
+        weighted_scores[code] = weighted_scores.get(code, 0.0) + weight * float(language.get("confidenceScore", 0))
+        languages.setdefault(code, language)
+    code = max(weighted_scores, key=weighted_scores.get)
+    return {
+        "detectedLanguage": {
+            **languages[code],
+            "confidenceScore": round(weighted_scores[code] / max(sum(weights), 1), 2),
+        }
+    }
+
+
+def _merge_sentiment(responses: List[Dict], weights: List[int], offsets: List[int]) -> Dict:
+    """
+    Average confidence scores weighted by segment length. As the API does for sentences within a document,
+    the sentiment is mixed if some segments are positive and others negative.
+    """
+    total_weight = max(sum(weights), 1)
+    confidence_scores = {}
+    for label in ["positive", "neutral", "negative"]:
+        scores = [float(r.get("confidenceScores", {}).get(label, 0)) for r in responses]
+        confidence_scores[label] = round(sum(w * score for w, score in zip(weights, scores)) / total_weight, 2)
+    sentiments = {r.get("sentiment") for r in responses}
+    sentiment = max(confidence_scores, key=confidence_scores.get)
+    if "mixed" in sentiments or {"positive", "negative"}.issubset(sentiments):
+        sentiment = "mixed"
+    sentences = []
+    for response, offset in zip(responses, offsets):
+        sentences.extend(_shift_offsets(response.get("sentences", []), offset))
+    return {"sentiment": sentiment, "confidenceScores": confidence_scores, "sentences": sentences}
+
+
+def _merge_key_phrases(responses: List[Dict]) -> Dict:
+    """
+    Interleave the key phrases of segments so that each segment is represented among the first ones,
+    and drop duplicates regardless of case
+    """
+    key_phrases = []
+    seen_key_phrases = set()
+    for round_key_phrases in zip_longest(*[r.get("keyPhrases", []) for r in responses]):
+        for key_phrase in round_key_phrases:
+            if key_phrase is not None and key_phrase.lower() not in seen_key_phrases:
+                seen_key_phrases.add(key_phrase.lower())
+                key_phrases.append(key_phrase)
+    return {"keyPhrases": key_phrases}
+
+
+def _merge_entities(responses: List[Dict], offsets: List[int], texts: List[AnyStr]) -> Dict:
+    """
+    Concatenate entities with offsets shifted to the text of the row, and rebuild the redacted text if any
+    """
+    merged_response = {"entities": []}
+    for response, offset in zip(responses, offsets):
+        merged_response["entities"].extend(_shift_offsets(response.get("entities", []), offset))
+    if all("redactedText" in r for r in responses):
+        # Segments are stripped when sent, so their trailing whitespace is added back between redacted segments
+        merged_response["redactedText"] = "".join(
+            r["redactedText"] + text[len(text.rstrip()) :] for r, text in zip(responses, texts)
+        ).rstrip()
+    return merged_response
+
+
+def merge_segment_responses(
+    segment_rows: List[Dict], responses: List[Dict], service: AnyStr, text_column: AnyStr
+) -> Dict:
+    """
+    Merge the API responses to the segments of a row into a single response in the format of the service:
+    - language detection: language with the highest confidence weighted by segment length
+    - sentiment: confidence scores weighted by segment length, sentences with shifted offsets
+    - key phrases: interleaved and deduplicated
+    - entities and PII: concatenated with offsets shifted to the text of the row, and redacted text rebuilt
+    Warnings of all segments are kept, and the id of the first segment is used.
+    """
+    texts = [str(row.get(text_column, "")) for row in segment_rows]
+    weights = [len(text.strip()) for text in texts]
+    offsets = [int(row.get(SEGMENT_OFFSET_KEY, 0)) for row in segment_rows]
+    merged_response = {"id": responses[0].get("id")}
+    if service == "languages":
+        merged_response.update(_merge_language(responses, weights))
+    elif service == "sentiment":
+        merged_response.update(_merge_sentiment(responses, weights, offsets))
+    elif service == "keyPhrases":
+        merged_response.update(_merge_key_phrases(responses))
+    elif service.startswith("entities/"):
+        merged_response.update(_merge_entities(responses, offsets, texts))
+    merged_response["warnings"] = [w for r in responses for w in r.get("warnings", [])]
+    return merged_response
@@ -1,16 +1,114 @@
 # -*- coding: utf-8 -*-
 """Module with read/write utility functions based on the Dataiku API"""
 
-from typing import Dict
+import logging
+import json
+from time import time, strftime
+from contextlib import ExitStack
+from typing import AnyStr, Callable, Dict, List
+
+import pandas as pd
 
 import dataiku
 
 
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+DEFAULT_CHUNK_SIZE = 10000
+# DSS storage types of pandas dtypes, other dtypes such as categories, strings and lists are stored as strings
+PANDAS_DTYPE_TO_DSS_TYPE = {
+    "bool": "boolean",
+    "boolean": "boolean",
+    "int8": "tinyint",
+    "int16": "smallint",
+    "int32": "int",
+    "int64": "bigint",
+    "Int8": "tinyint",
+    "Int16": "smallint",
+    "Int32": "int",
+    "Int64": "bigint",
+    "float32": "float",
+    "float64": "double",
+    "datetime64[ns]": "date",
+}
+
+
 # ==============================================================================
 # CLASS AND FUNCTION DEFINITION
 # ==============================================================================
 
 
+def build_dss_schema(df: pd.DataFrame, input_schema: List[Dict] = None) -> List[Dict]:
+    """
+    Build the DSS schema of a dataframe explicitly from the dtypes of its columns:
+    - columns from the input schema keep their type in the input dataset
+    - other columns are typed from their pandas dtype, e.g. float32 columns are stored as DSS float
+    - categories, strings, lists and other objects are stored as DSS strings
+    """
+    input_schema_dict = {column["name"]: column for column in input_schema or []}
+    schema = []
+    for column_name, dtype in df.dtypes.items():
+        if column_name in input_schema_dict:
+            schema.append(dict(input_schema_dict[column_name]))
+        else:
+            schema.append({"name": column_name, "type": PANDAS_DTYPE_TO_DSS_TYPE.get(str(dtype), "string")})
+    return schema
+
+
+def process_dataset_chunks(
+    input_dataset: dataiku.Dataset,
+    output_dataset: dataiku.Dataset,
+    func: Callable,
+    chunksize: int = DEFAULT_CHUNK_SIZE,
+    secondary_output_dataset: dataiku.Dataset = None,
+    **kwargs
+) -> None:
+    """
+    Read a dataset by chunks, apply a function to each chunk and write the result to another dataset.
+    The output schema is built explicitly from the dtypes of the first processed chunk and the input schema,
+    which is then appended through a dataset writer.
+    Peak memory depends on the chunk size, not on the dataset size.
+    Chunks are indexed by row number in the input dataset, so that the index identifies rows across chunks.
+    If a secondary output dataset is given, the function returns a tuple of dataframes for both outputs,
+    and the secondary output is streamed through its own writer in the same way.
+    """
+    chunksize = int(chunksize or DEFAULT_CHUNK_SIZE)
+    logging.info("Processing dataset {} by chunks of {} rows...".format(input_dataset.name, chunksize))
+    start = time()
+    num_input_rows = 0
+    num_rows = 0
+    output_datasets = [output_dataset]
+    input_schemas = [input_dataset.read_schema()]
+    if secondary_output_dataset is not None:
+        output_datasets.append(secondary_output_dataset)
+        input_schemas.append(None)
+    with ExitStack() as stack:
+        writers = [stack.enter_context(dataset.get_writer()) for dataset in output_datasets]
+        for i, input_df in enumerate(input_dataset.iter_dataframes(chunksize=chunksize, infer_with_pandas=False)):
+            input_df.index = pd.RangeIndex(num_input_rows, num_input_rows + len(input_df.index))
+            num_input_rows += len(input_df.index)
+            output_dfs = func(df=input_df, **kwargs)
+            if secondary_output_dataset is None:
+                output_dfs = (output_dfs,)
+            for dataset, input_schema, writer, output_df in zip(output_datasets, input_schemas, writers, output_dfs):
+                if i == 0:
+                    dataset.write_schema(
+                        build_dss_schema(output_df, input_schema), dropAndCreate=bool(not dataset.writePartition)
+                    )
+                writer.write_dataframe(output_df)
+            num_rows += len(output_dfs[0].index)
+            logging.info("Processed chunk {} ({} rows so far)".format(i + 1, num_rows))
+    if num_rows == 0:
+        raise ValueError("Input dataset {} has no records".format(input_dataset.name))
+    logging.info(
+        "Processing dataset {} of {} rows by chunks of {}: Done in {:.2f} seconds.".format(
+            input_dataset.name, num_rows, chunksize, time() - start
+        )
+    )
+
+
 def set_column_description(
     output_dataset: dataiku.Dataset, column_description_dict: Dict, input_dataset: dataiku.Dataset = None,
 ) -> None:
@@ -36,3 +134,15 @@ def set_column_description(
             if len(matched_comment) != 0:
                 output_col_info["comment"] = matched_comment[0]
     output_dataset.write_schema(output_dataset_schema)
+
+
+def write_run_report(folder: dataiku.Folder, report: Dict, run_name: AnyStr) -> AnyStr:
+    """
+    Write a run report as a JSON file in a managed folder, named after the run and the current time.
+    Return the name of the file.
+    """
+    file_name = "{}_{}.json".format(run_name, strftime("%Y%m%d-%H%M%S"))
+    with folder.get_writer(file_name) as writer:
+        writer.write(json.dumps(report, indent=2).encode("utf-8"))
+    logging.info("Run report written to {} in folder {}".format(file_name, folder.get_id()))
+    return file_name
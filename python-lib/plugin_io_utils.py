@@ -4,17 +4,24 @@
 import logging
 import json
 from enum import Enum
-from typing import AnyStr, List, NamedTuple, Dict
+from typing import AnyStr, List, NamedTuple, Dict, Union
 from collections import OrderedDict, namedtuple
 
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # ==============================================================================
 # CONSTANT DEFINITION
 # ==============================================================================
 
 COLUMN_PREFIX = "api"
+# Nullable string dtype of pandas >= 1.0, falling back to object columns on the older pandas of Python 3.5 code envs
+STRING_DTYPE = "string" if hasattr(pd, "StringDtype") else "object"
 API_COLUMN_NAMES_DESCRIPTION_DICT = OrderedDict(
     [
         ("response", "Raw response from the API in JSON format"),
@@ -32,6 +39,11 @@ class ErrorHandlingEnum(Enum):
     FAIL = "Fail"
 
 
+class ParallelEngineEnum(Enum):
+    THREADS = "Threads"
+    ASYNCIO = "asyncio"
+
+
 # ==============================================================================
 # CLASS AND FUNCTION DEFINITION
 # ==============================================================================
@@ -73,6 +85,24 @@ def validate_column_input(column_name: AnyStr, column_list: List[AnyStr]) -> Non
         raise ValueError("Column '{}' is not present in the input dataset.".format(column_name))
 
 
+def json_loads(str_to_load: AnyStr) -> Union[Dict, List]:
+    """
+    Decode JSON with orjson if available, else with the standard json module
+    """
+    if orjson is not None:
+        return orjson.loads(str_to_load)
+    return json.loads(str_to_load)
+
+
+def json_dumps(obj: Union[Dict, List]) -> AnyStr:
+    """
+    Encode JSON with orjson if available, else with the standard json module
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
 def safe_json_loads(
     str_to_check: AnyStr, error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG, verbose: bool = False,
 ) -> Dict:
@@ -80,12 +110,15 @@ def safe_json_loads(
     Wrap json.loads with an additional parameter to handle errors:
     - 'FAIL' to use json.loads, which throws an exception on invalid data
     - 'LOG' to try json.loads and return an empty dict if data is invalid
+    Already decoded objects (dict or list) are returned as is.
     """
+    if isinstance(str_to_check, (dict, list)):
+        return str_to_check
     if error_handling == ErrorHandlingEnum.FAIL:
-        output = json.loads(str_to_check)
+        output = json_loads(str_to_check)
     else:
         try:
-            output = json.loads(str_to_check)
+            output = json_loads(str_to_check)
         except (TypeError, ValueError):
             if verbose:
                 logging.warning("Invalid JSON: '" + str(str_to_check) + "'")
@@ -93,6 +126,13 @@ def safe_json_loads(
     return output
 
 
+def serialize_json_column(values: List) -> List[AnyStr]:
+    """
+    Encode decoded JSON objects of a column to strings, leaving other values as is
+    """
+    return [json_dumps(v) if isinstance(v, (dict, list)) else v for v in values]
+
+
 def move_api_columns_to_end(
     df: pd.DataFrame, api_column_names: NamedTuple, error_handling: ErrorHandlingEnum = ErrorHandlingEnum.LOG
 ) -> pd.DataFrame:
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end throughput benchmark of the plugin call path against the local mock Text Analytics server.
+Each case of the grid (service x engine x parallel_workers x batch_size x dataset size) runs in a fresh process,
+through the same path as the recipes: AzureNLPAPIWrapper, api_parallelizer with the batch settings
+of build_batch_kwargs, then the service formatter, chunk by chunk.
+
+Absolute timings depend on the host, so the stored baseline holds the speedup of each case over the same case
+with a single worker, measured in the same run. Runs fail if a speedup drops by more than the tolerance,
+or if a case has more errors than in the baseline.
+
+Usage: python benchmark_throughput.py [--update-baseline] [--help]
+"""
+
+import os
+import re
+import sys
+import json
+import random
+import inspect
+import logging
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import AnyStr, Callable, Dict, List
+
+import pandas as pd
+
+from plugin_io_utils import ErrorHandlingEnum, ParallelEngineEnum
+from api_parallelizer import api_parallelizer
+from azure_nlp_api_client import API_EXCEPTIONS, AzureNLPAPIWrapper, build_batch_kwargs
+from azure_nlp_api_formatting import (
+    EntityTypeEnum,
+    LanguageDetectionAPIFormatter,
+    SentimentAnalysisAPIFormatter,
+    NamedEntityRecognitionAPIFormatter,
+    KeyPhraseExtractionAPIFormatter,
+)
+from mock_text_analytics_server import MockServerConfig, MockTextAnalyticsServer
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SERVICES = ["sentiment"]
+DEFAULT_ENGINES = ["THREADS", "ASYNCIO"]
+DEFAULT_PARALLEL_WORKERS = [1, 4, 16]
+DEFAULT_BATCH_SIZES = [1, 10]
+DEFAULT_NUM_ROWS = [100, 1000]
+CHUNK_SIZE = 10000  # Same default as dku_io_utils, which cannot be imported outside of DSS
+DEFAULT_TOLERANCE = 0.5  # Relative loss of speedup allowed against the baseline before failing
+TEXT_COLUMN = "text"
+VOCABULARY = ["Alice", "Bob", "Paris", "London", "market", "quarterly", "results", "were", "better", "than"]
+VOCABULARY += ["expected", "the", "team", "shipped", "a", "new", "product", "and", "customers", "loved", "it"]
+
+# Wrapper method, formatter class and formatter parameters of each service, as in the recipes
+SERVICE_CALL_PATHS = {
+    "languages": ("detect_language", LanguageDetectionAPIFormatter, {}),
+    "sentiment": ("analyze_sentiment", SentimentAnalysisAPIFormatter, {}),
+    "entities/recognition/general": (
+        "recognize_entities_general",
+        NamedEntityRecognitionAPIFormatter,
+        {"entity_types": list(EntityTypeEnum), "minimum_score": 0},
+    ),
+    "keyPhrases": ("extract_keyphrases", KeyPhraseExtractionAPIFormatter, {"num_key_phrases": 3}),
+}
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def generate_dataset(num_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Generate unique documents of 5 to 60 words, so that deduplication does not skew throughput
+    """
+    rng = random.Random(seed)
+    texts = [
+        "Document {}: {}".format(i, " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 60))))
+        for i in range(num_rows)
+    ]
+    return pd.DataFrame({"id": range(num_rows), TEXT_COLUMN: texts})
+
+
+def timed(api_function: Callable, latencies: List[float]) -> Callable:
+    """
+    Record the latency of each call to an API function, including rate limiting and retries,
+    whether it returns a result or an awaitable (asyncio engine)
+    """
+
+    async def await_timed(awaitable, start):
+        response = await awaitable
+        latencies.append(perf_counter() - start)
+        return response
+
+    def timed_api_function(data):
+        start = perf_counter()
+        response = api_function(data)
+        if inspect.isawaitable(response):
+            return await_timed(response, start)
+        latencies.append(perf_counter() - start)
+        return response
+
+    return timed_api_function
+
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def get_peak_rss_mb() -> float:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024.0 * 1024.0) if sys.platform == "darwin" else peak_rss / 1024.0  # bytes on macOS
+
+
+def run_case(case: Dict) -> Dict:
+    """
+    Run one benchmark case in the current process and return its metrics
+    """
+    logging.disable(logging.WARNING)
+    os.environ["AZURE_TEXT_ANALYTICS_ENDPOINT"] = case["endpoint"]
+    service = case["service"]
+    method_name, formatter_class, formatter_kwargs = SERVICE_CALL_PATHS[service]
+    api_configuration_preset = {
+        "azure_api_key": "mock",
+        "azure_region": "",
+        "api_quota_period": 1,
+        "api_quota_rate_limit": 100000,
+        "parallel_engine": case["parallel_engine"],
+        "parallel_workers": case["parallel_workers"],
+        "async_concurrency": case["parallel_workers"],
+        "batch_size": case["batch_size"],
+    }
+    api_wrapper = AzureNLPAPIWrapper(api_configuration_preset)
+    latencies = []
+    api_function = timed(getattr(api_wrapper, method_name), latencies)
+    input_df = generate_dataset(case["num_rows"])
+    api_formatter = formatter_class(
+        input_df=input_df.iloc[:0], column_prefix="api", error_handling=ErrorHandlingEnum.LOG, **formatter_kwargs
+    )
+
+    def call_api(batch: List[Dict], text_column: AnyStr) -> Dict:
+        language_key = "countryHint" if service == "languages" else "language"
+        language_value = "" if service == "languages" else "en"
+        document_list = {
+            "documents": [
+                {"id": str(index), "text": str(row.get(text_column, "")).strip(), language_key: language_value}
+                for index, row in enumerate(batch)
+            ]
+        }
+        return api_function(document_list)
+
+    start = perf_counter()
+    num_errors = 0
+    for i in range(0, len(input_df.index), CHUNK_SIZE):
+        df = api_parallelizer(
+            input_df=input_df.iloc[i : i + CHUNK_SIZE],
+            api_call_function=call_api,
+            api_exceptions=API_EXCEPTIONS,
+            column_prefix="api",
+            text_column=TEXT_COLUMN,
+            parallel_workers=case["parallel_workers"],
+            parallel_engine=ParallelEngineEnum[case["parallel_engine"]],
+            api_input_columns=[TEXT_COLUMN],
+            deduplication_columns=[TEXT_COLUMN],
+            **build_batch_kwargs(service=service, batch_size=case["batch_size"], text_column=TEXT_COLUMN)
+        )
+        output_df = api_formatter.format_df(df)
+        num_errors += int(sum(output_df["api_error_message"] != ""))
+    duration = perf_counter() - start
+    api_wrapper.close()
+    return {
+        "num_rows": case["num_rows"],
+        "num_errors": num_errors,
+        "duration": round(duration, 3),
+        "rows_per_second": round(case["num_rows"] / duration, 1),
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+    }
+
+
+def build_case_name(case: Dict) -> AnyStr:
+    return "{service}|{parallel_engine}|workers={parallel_workers}|batch={batch_size}|rows={num_rows}".format(**case)
+
+
+def run_benchmark(
+    services: List[AnyStr] = DEFAULT_SERVICES,
+    engines: List[AnyStr] = DEFAULT_ENGINES,
+    parallel_workers: List[int] = DEFAULT_PARALLEL_WORKERS,
+    batch_sizes: List[int] = DEFAULT_BATCH_SIZES,
+    num_rows: List[int] = DEFAULT_NUM_ROWS,
+    server_config: MockServerConfig = None,
+) -> Dict[AnyStr, Dict]:
+    """
+    Run the grid of benchmark cases against a mock server, each case in a fresh process
+    so that peak memory is measured per case. Return metrics by case name.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with MockTextAnalyticsServer(server_config or MockServerConfig(seed=42)) as server:
+        for service in services:
+            for engine in engines:
+                for workers in parallel_workers:
+                    for batch_size in batch_sizes:
+                        for rows in num_rows:
+                            case = {
+                                "endpoint": server.endpoint,
+                                "service": service,
+                                "parallel_engine": engine,
+                                "parallel_workers": workers,
+                                "batch_size": batch_size,
+                                "num_rows": rows,
+                            }
+                            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                                metrics = pool.submit(run_case, case).result()
+                            results[build_case_name(case)] = metrics
+                            print("{:<70} {}".format(build_case_name(case), json.dumps(metrics)), flush=True)
+        print("Mock server: {}".format(json.dumps(server.stats())))
+    return results
+
+
+def compute_speedups(results: Dict[AnyStr, Dict]) -> Dict[AnyStr, Dict]:
+    """
+    Compute the speedup of each case with several workers over the same case with a single worker,
+    which does not depend on the speed of the host, along with its number of errors
+    """
+    speedups = {}
+    for case_name, metrics in results.items():
+        sequential_case_name = re.sub(r"\|workers=\d+\|", "|workers=1|", case_name)
+        if sequential_case_name == case_name or sequential_case_name not in results:
+            continue
+        speedup = metrics["rows_per_second"] / max(results[sequential_case_name]["rows_per_second"], 1e-9)
+        speedups[case_name] = {"speedup": round(speedup, 2), "num_errors": metrics["num_errors"]}
+    return speedups
+
+
+def compare_to_baseline(results: Dict[AnyStr, Dict], baseline: Dict[AnyStr, Dict], tolerance: float) -> List[AnyStr]:
+    """
+    Return a description of every speedup which dropped by more than the tolerance against the baseline,
+    and of every case with more errors. Cases absent from the baseline are not compared.
+    """
+    regressions = []
+    for case_name, metrics in compute_speedups(results).items():
+        if case_name not in baseline:
+            continue
+        expected = baseline[case_name]
+        checks = [
+            ("speedup", metrics["speedup"] < expected["speedup"] * (1 - tolerance)),
+            ("num_errors", metrics["num_errors"] > expected["num_errors"]),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append(
+                    "{}: {} regressed from {} to {}".format(case_name, metric, expected[metric], metrics[metric])
+                )
+    return regressions
+
+
+def load_baseline(baseline_path: AnyStr = BASELINE_PATH) -> Dict[AnyStr, Dict]:
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", nargs="+", default=DEFAULT_SERVICES, choices=list(SERVICE_CALL_PATHS))
+    parser.add_argument("--engines", nargs="+", default=DEFAULT_ENGINES, choices=[e.name for e in ParallelEngineEnum])
+    parser.add_argument("--parallel-workers", nargs="+", type=int, default=DEFAULT_PARALLEL_WORKERS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--num-rows", nargs="+", type=int, default=DEFAULT_NUM_ROWS)
+    parser.add_argument("--latency-distribution", default="lognormal")
+    parser.add_argument("--latency-median", type=float, default=0.01, help="Median request latency in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store results as the new baseline")
+    args = parser.parse_args()
+    server_config = MockServerConfig(
+        latency_distribution=args.latency_distribution,
+        latency_median=args.latency_median,
+        throttle_rate=args.throttle_rate,
+        server_error_rate=args.server_error_rate,
+        seed=42,
+    )
+    results = run_benchmark(
+        args.services, args.engines, args.parallel_workers, args.batch_sizes, args.num_rows, server_config
+    )
+    if args.update_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline.update(compute_speedups(results))
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        print("Baseline updated: {}".format(args.baseline))
+        return
+    regressions = compare_to_baseline(results, load_baseline(args.baseline), args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    sys.exit(1 if len(regressions) != 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
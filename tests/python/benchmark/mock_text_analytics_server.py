@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the Azure Text Analytics API v3.0, to benchmark the plugin without network or quota"""
+
+import json
+import gzip
+import random
+import threading
+from time import sleep
+from collections import Counter
+from typing import AnyStr, Dict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from azure_nlp_api_client import API_SERVICE_LIMITS
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+API_PATH_PREFIX = "/text/analytics/v3.0/"
+LATENCY_DISTRIBUTIONS = ["constant", "uniform", "lognormal"]
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+class MockServerConfig:
+    """
+    Behaviour of the mock server:
+    - latency of each request in seconds: a fixed part drawn from a distribution around latency_median,
+      plus latency_per_document for each document of the request
+    - probability of answering HTTP 429 with a Retry-After delay, or HTTP 503
+    - per-request document limits, taken from the plugin's own API_SERVICE_LIMITS unless overridden
+    """
+
+    def __init__(
+        self,
+        latency_distribution: AnyStr = "lognormal",
+        latency_median: float = 0.01,
+        latency_sigma: float = 0.5,
+        latency_per_document: float = 0.0005,
+        throttle_rate: float = 0.0,
+        retry_after: float = 0.05,
+        server_error_rate: float = 0.0,
+        service_limits: Dict = None,
+        seed: int = None,
+    ):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError("Latency distribution must be one of {}".format(LATENCY_DISTRIBUTIONS))
+        self.latency_distribution = latency_distribution
+        self.latency_median = float(latency_median)
+        self.latency_sigma = float(latency_sigma)
+        self.latency_per_document = float(latency_per_document)
+        self.throttle_rate = float(throttle_rate)
+        self.retry_after = float(retry_after)
+        self.server_error_rate = float(server_error_rate)
+        self.service_limits = service_limits or API_SERVICE_LIMITS
+        self.random = random.Random(seed)
+
+    def sample_latency(self, num_documents: int) -> float:
+        if self.latency_distribution == "constant":
+            latency = self.latency_median
+        elif self.latency_distribution == "uniform":
+            latency = self.random.uniform(0, 2 * self.latency_median)
+        else:
+            latency = self.random.lognormvariate(0, self.latency_sigma) * self.latency_median
+        return latency + num_documents * self.latency_per_document
+
+
+def _document_error(document_id: AnyStr, message: AnyStr) -> Dict:
+    return {
+        "id": document_id,
+        "error": {
+            "code": "InvalidArgument",
+            "message": "Invalid document in request.",
+            "innererror": {"code": "InvalidDocument", "message": message},
+        },
+    }
+
+
+def _request_error(code: AnyStr, message: AnyStr) -> Dict:
+    return {
+        "error": {
+            "code": "InvalidRequest",
+            "message": "Invalid Request.",
+            "innererror": {"code": code, "message": message},
+        }
+    }
+
+
+def analyze_document(service: AnyStr, document: Dict) -> Dict:
+    """
+    Return a deterministic result in the format of each service, derived from the document text
+    """
+    text = document.get("text", "")
+    words = text.split()
+    result = {"id": document["id"], "warnings": []}
+    if service == "languages":
+        result["detectedLanguage"] = {"name": "English", "iso6391Name": "en", "confidenceScore": 1.0}
+    elif service == "sentiment":
+        positive = (len(text) % 10) / 10.0
+        scores = {"positive": positive, "neutral": 0.0, "negative": round(1 - positive, 1)}
+        result["sentiment"] = max(scores, key=scores.get)
+        result["confidenceScores"] = scores
+        result["sentences"] = [
+            {
+                "text": text,
+                "sentiment": result["sentiment"],
+                "confidenceScores": scores,
+                "offset": 0,
+                "length": len(text),
+            }
+        ]
+    elif service == "keyPhrases":
+        result["keyPhrases"] = words[:3]
+    elif service.startswith("entities/recognition"):
+        entities = []
+        offset = 0
+        for word in words:
+            offset = text.find(word, offset)
+            if word[:1].isupper():
+                category = "Person" if service == "entities/recognition/general" else "Organization"
+                entities.append(
+                    {"text": word, "category": category, "offset": offset, "length": len(word), "confidenceScore": 0.9}
+                )
+            offset += len(word)
+        result["entities"] = entities
+        if service == "entities/recognition/pii":
+            redacted_text = list(text)
+            for entity in entities:
+                redacted_text[entity["offset"] : entity["offset"] + entity["length"]] = "*" * entity["length"]
+            result["redactedText"] = "".join(redacted_text)
+    return result
+
+
+class MockTextAnalyticsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Avoid 40 ms delayed ACKs between headers and body on keep-alive connections
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Dict = None) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.record(status)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        config = self.server.config
+        content = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        service = self.path[len(API_PATH_PREFIX) :] if self.path.startswith(API_PATH_PREFIX) else ""
+        if service not in config.service_limits:
+            return self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+        if not self.headers.get("Ocp-Apim-Subscription-Key"):
+            return self._send_json(401, {"error": {"code": "401", "message": "Access denied due to missing key."}})
+        if self.headers.get("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        documents = json.loads(content.decode("utf-8")).get("documents", [])
+        sleep(config.sample_latency(len(documents)))
+        with self.server.lock:
+            draw = config.random.random()
+        if draw < config.throttle_rate:
+            retry_after_ms = str(int(config.retry_after * 1000))
+            return self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                headers={"Retry-After": str(max(int(config.retry_after), 1)), "retry-after-ms": retry_after_ms},
+            )
+        if draw < config.throttle_rate + config.server_error_rate:
+            return self._send_json(503, {"error": {"code": "ServiceUnavailable", "message": "Service unavailable."}})
+        limits = config.service_limits[service]
+        if len(documents) > limits.max_documents:
+            message = "Batch request contains too many records. Max {} records are permitted.".format(
+                limits.max_documents
+            )
+            return self._send_json(400, _request_error("InvalidDocumentBatch", message))
+        if sum(len(d.get("text", "")) for d in documents) > limits.max_request_characters:
+            message = "Request Payload sent is too large to be processed."
+            return self._send_json(413, _request_error("InvalidDocumentBatch", message))
+        results, errors = [], []
+        for document in documents:
+            text = document.get("text", "")
+            if text == "":
+                errors.append(_document_error(document["id"], "Document text is empty."))
+            elif len(text) > limits.max_document_characters:
+                message = (
+                    "A document within the request was too large to be processed. "
+                    "Limit document size to: {} text elements.".format(limits.max_document_characters)
+                )
+                errors.append(_document_error(document["id"], message))
+            else:
+                results.append(analyze_document(service, document))
+        with self.server.lock:
+            self.server.num_documents += len(documents)
+        self._send_json(200, {"documents": results, "errors": errors, "modelVersion": "2021-01-01"})
+
+
+class MockTextAnalyticsServer(ThreadingMixIn, HTTPServer):
+    """
+    Mock Text Analytics server running in a background thread, to be used as a context manager.
+    Counts requests by HTTP status and documents analyzed.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024  # Accept bursts of new connections without SYN retransmits
+
+    def __init__(self, config: MockServerConfig = None, host: AnyStr = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockTextAnalyticsHandler)
+        self.config = config or MockServerConfig()
+        self.lock = threading.Lock()
+        self.status_counts = Counter()
+        self.num_documents = 0
+        self._thread = None
+
+    @property
+    def endpoint(self) -> AnyStr:
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def record(self, status: int) -> None:
+        with self.lock:
+            self.status_counts[status] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "num_requests": sum(self.status_counts.values()),
+                "num_documents": self.num_documents,
+                "status_counts": {str(k): v for k, v in self.status_counts.items()},
+            }
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from typing import AnyStr, Dict, List
+
+from plugin_io_utils import ErrorHandlingEnum, ParallelEngineEnum, build_unique_column_names
+from api_parallelizer import api_parallelizer
+from azure_nlp_api_client import (
+    API_EXCEPTIONS,
+    AzureNLPAPIWrapper,
+    batch_api_response_parser,
+    build_batch_kwargs,
+    parse_api_error,
+)
+from mock_text_analytics_server import MockServerConfig, MockTextAnalyticsServer
+from benchmark_throughput import DEFAULT_TOLERANCE, compare_to_baseline, generate_dataset, load_baseline, run_benchmark
+
+
+def test_mock_server_errors_are_retried(monkeypatch):
+    config = MockServerConfig(latency_median=0.001, throttle_rate=0.2, retry_after=0.01, server_error_rate=0.1, seed=0)
+    with MockTextAnalyticsServer(config) as server:
+        monkeypatch.setenv("AZURE_TEXT_ANALYTICS_ENDPOINT", server.endpoint)
+        monkeypatch.setattr("azure_nlp_api_client.compute_backoff", lambda attempt: 0.01)
+        api_wrapper = AzureNLPAPIWrapper({"azure_api_key": "mock", "api_quota_rate_limit": 1000, "api_quota_period": 1})
+        api_wrapper.max_attempts = 10
+
+        def call_api(batch: List[Dict], text_column: AnyStr) -> Dict:
+            documents = [{"id": str(i), "text": row[text_column], "language": "en"} for i, row in enumerate(batch)]
+            return api_wrapper.analyze_sentiment({"documents": documents})
+
+        df = api_parallelizer(
+            input_df=generate_dataset(50),
+            api_call_function=call_api,
+            api_exceptions=API_EXCEPTIONS,
+            column_prefix="api",
+            text_column="text",
+            error_handling=ErrorHandlingEnum.FAIL,
+            **build_batch_kwargs(service="sentiment", batch_size=10, text_column="text")
+        )
+        api_wrapper.close()
+        stats = server.stats()
+    assert all(df["api_response"] != "")
+    assert stats["num_documents"] == 50
+    assert stats["status_counts"].get("429", 0) + stats["status_counts"].get("503", 0) > 0
+
+
+def test_mock_server_enforces_document_limits(monkeypatch):
+    with MockTextAnalyticsServer(MockServerConfig(latency_median=0.001)) as server:
+        monkeypatch.setenv("AZURE_TEXT_ANALYTICS_ENDPOINT", server.endpoint)
+        api_wrapper = AzureNLPAPIWrapper({"azure_api_key": "mock"})
+        too_many_documents = {"documents": [{"id": str(i), "text": "text", "language": "en"} for i in range(11)]}
+        response = api_wrapper.analyze_sentiment(too_many_documents)
+        api_wrapper.close()
+    assert parse_api_error(response)[1] == "InvalidDocumentBatch"
+
+
+def test_mock_server_document_errors_are_parsed(monkeypatch):
+    with MockTextAnalyticsServer(MockServerConfig(latency_median=0.001)) as server:
+        monkeypatch.setenv("AZURE_TEXT_ANALYTICS_ENDPOINT", server.endpoint)
+        api_wrapper = AzureNLPAPIWrapper({"azure_api_key": "mock"})
+        batch = [{"text": "Some text"}, {"text": ""}]
+        documents = [{"id": str(i), "text": row["text"], "language": "en"} for i, row in enumerate(batch)]
+        response = api_wrapper.analyze_sentiment({"documents": documents})
+        api_wrapper.close()
+    api_column_names = build_unique_column_names([], "api")
+    batch = batch_api_response_parser(batch, response, api_column_names)
+    assert batch[0][api_column_names.error_type] == ""
+    assert batch[1][api_column_names.error_type] == "InvalidDocument"
+    assert batch[1][api_column_names.error_message] == "Document text is empty."
+
+
+def test_async_connection_stats(monkeypatch):
+    with MockTextAnalyticsServer(MockServerConfig(latency_median=0.001)) as server:
+        monkeypatch.setenv("AZURE_TEXT_ANALYTICS_ENDPOINT", server.endpoint)
+        api_wrapper = AzureNLPAPIWrapper(
+            {"azure_api_key": "mock", "parallel_engine": "ASYNCIO", "async_concurrency": 2}
+        )
+
+        def call_api(batch: List[Dict], text_column: AnyStr) -> Dict:
+            documents = [{"id": str(i), "text": row[text_column], "language": "en"} for i, row in enumerate(batch)]
+            return api_wrapper.analyze_sentiment({"documents": documents})
+
+        api_parallelizer(
+            input_df=generate_dataset(50),
+            api_call_function=call_api,
+            api_exceptions=API_EXCEPTIONS,
+            column_prefix="api",
+            text_column="text",
+            parallel_workers=2,
+            parallel_engine=ParallelEngineEnum.ASYNCIO,
+            error_handling=ErrorHandlingEnum.FAIL,
+            **build_batch_kwargs(service="sentiment", batch_size=10, text_column="text")
+        )
+        stats = api_wrapper.connection_stats()
+        api_wrapper.close()
+    assert 1 <= stats["opened"] <= 2
+    assert stats["opened"] + stats["reused"] == 5
+
+
+def test_throughput_against_baseline():
+    results = run_benchmark()
+    regressions = compare_to_baseline(results, load_baseline(), DEFAULT_TOLERANCE)
+    assert regressions == []
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from api_concurrency_controller import AIMDConcurrencyController  # noqa
+from api_rate_limiter import TokenBucketRateLimiter  # noqa
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def record_window(controller: AIMDConcurrencyController, latency: float, num_errors: int = 0) -> None:
+    for _ in range(max(controller.concurrency, 4)):
+        controller.record(latency, num_rows=10, num_errors=num_errors)
+
+
+def test_controller_increases_concurrency_without_congestion():
+    controller = AIMDConcurrencyController(
+        initial_concurrency=1, max_concurrency=6, initial_batch_size=2, max_batch_size=10
+    )
+    concurrency_history = []
+    for _ in range(5):
+        record_window(controller, latency=0.1)
+        concurrency_history.append(controller.concurrency)
+    assert concurrency_history == [2, 4, 6, 6, 6]  # slow start, capped at the maximum
+    assert controller.batch_size == 4  # then batches grow
+
+
+def test_controller_decreases_on_throttling_and_latency():
+    rate_limiter = TokenBucketRateLimiter(rate_limit=1000, period=1)
+    controller = AIMDConcurrencyController(
+        initial_concurrency=8,
+        max_concurrency=8,
+        initial_batch_size=10,
+        max_batch_size=10,
+        throttle_counter=rate_limiter,
+    )
+    rate_limiter.pause(0)
+    record_window(controller, latency=0.1)
+    assert (controller.concurrency, controller.batch_size) == (4, 10)
+    record_window(controller, latency=0.1)
+    assert (controller.concurrency, controller.batch_size) == (5, 10)  # additive increase after slow start
+    record_window(controller, latency=0.5)
+    assert (controller.concurrency, controller.batch_size) == (2, 5)
+    record_window(controller, latency=0.1, num_errors=5)
+    assert (controller.concurrency, controller.batch_size) == (1, 2)
+    assert controller.num_adjustments == 4
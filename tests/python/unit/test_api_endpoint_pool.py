@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import pytest
+
+from api_rate_limiter import TokenBucketRateLimiter  # noqa
+from api_endpoint_pool import APIEndpoint, EndpointPool  # noqa
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def build_endpoint(name, rate_limit):
+    return APIEndpoint(
+        name=name,
+        base_url="http://{}/".format(name),
+        headers={"Ocp-Apim-Subscription-Key": name},
+        rate_limiter=TokenBucketRateLimiter(rate_limit=rate_limit, period=1),
+    )
+
+
+def test_select_least_loaded_endpoint():
+    pool = EndpointPool([build_endpoint("a", 1000), build_endpoint("b", 1000), build_endpoint("c", 2000)])
+    selected_names = [pool.select().name for _ in range(4)]
+    # c has twice the quota of a and b, so it takes two requests in flight for each of theirs
+    assert sorted(selected_names) == ["a", "b", "c", "c"]
+    pool = EndpointPool([build_endpoint("a", 10), build_endpoint("b", 10)])
+    assert [pool.select().name for _ in range(3)] == ["a", "b", "a"]
+    # b has used its quota for the next 100 ms, so a is preferred even with more requests in flight
+    pool.endpoints[1].rate_limiter.acquire()
+    assert pool.select().name == "a"
+
+
+def test_cooldown_after_errors():
+    pool = EndpointPool([build_endpoint("a", 1000), build_endpoint("b", 1000)], cooldown_base=10)
+    with pool.track_request(num_documents=5) as request:
+        request["status"] = 200
+    first_endpoint = request["endpoint"]
+    with pytest.raises(ConnectionError):
+        with pool.track_request(num_documents=5) as request:
+            raise ConnectionError
+    failed_endpoint = request["endpoint"]
+    assert failed_endpoint.cooldown_until > 0
+    assert all(pool.select() is not failed_endpoint for _ in range(5))
+    with pool.track_request(num_documents=5) as request:
+        request["status"] = 400
+    stats = {endpoint_stats["name"]: endpoint_stats for endpoint_stats in pool.stats()}
+    assert stats[first_endpoint.name]["documents"] == 5
+    assert stats[failed_endpoint.name]["status_counts"]["ConnectionError"] == 1
+    assert sum(s["requests"] for s in stats.values()) == 3
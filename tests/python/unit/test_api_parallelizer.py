@@ -4,14 +4,17 @@
 # see https://docs.pytest.org for more information
 
 import json
-from typing import AnyStr, Dict
+from typing import AnyStr, Dict, List
 from enum import Enum
 
+import pytest
 import pandas as pd
 from requests.exceptions import RequestException
 
-from api_parallelizer import api_parallelizer  # noqa
-
+from api_parallelizer import api_parallelizer, pack_batches, BatchAPIError  # noqa
+from api_checkpoint import CheckpointJournal  # noqa
+from api_concurrency_controller import AIMDConcurrencyController  # noqa
+from plugin_io_utils import STRING_DTYPE, ErrorHandlingEnum, ParallelEngineEnum  # noqa
 
 # ==============================================================================
 # CONSTANT DEFINITION
@@ -45,6 +48,28 @@ class APICaseEnum(Enum):
 # ==============================================================================
 
 
+class RecordingProgressBar:
+    """
+    Progress bar recording its total and the progress made, in place of tqdm
+    """
+
+    instances = []
+
+    def __init__(self, total: int):
+        self.total = total
+        self.n = 0
+        RecordingProgressBar.instances.append(self)
+
+    def update(self, n: int) -> None:
+        self.n += n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
 def call_mock_api(row: Dict, api_function_param: int = 42) -> AnyStr:
     test_case = row.get(INPUT_COLUMN)
     response = {}
@@ -60,6 +85,10 @@ def call_mock_api(row: Dict, api_function_param: int = 42) -> AnyStr:
     return json.dumps(response)
 
 
+async def call_mock_api_async(row: Dict, api_function_param: int = 42) -> AnyStr:
+    return call_mock_api(row, api_function_param)
+
+
 def test_api_success():
     input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS]})
     df = api_parallelizer(
@@ -95,3 +124,236 @@ def test_invalid_input():
     expected_dictionary = APICaseEnum.INVALID_INPUT.value
     for k in expected_dictionary:
         assert output_dictionary[k] == expected_dictionary[k]
+
+
+def test_api_asyncio_engine():
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS, APICaseEnum.API_FAILURE]})
+    df = api_parallelizer(
+        input_df=input_df,
+        api_call_function=call_mock_api_async,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=COLUMN_PREFIX,
+        parallel_engine=ParallelEngineEnum.ASYNCIO,
+    )
+    for test_case in APICaseEnum.SUCCESS, APICaseEnum.API_FAILURE:
+        output_dictionary = df[df[INPUT_COLUMN] == test_case].iloc[0, :].to_dict()
+        expected_dictionary = test_case.value
+        for k in expected_dictionary:
+            assert output_dictionary[k] == expected_dictionary[k]
+
+
+def test_deduplication_preserves_row_order():
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS, APICaseEnum.API_FAILURE, APICaseEnum.SUCCESS]})
+    input_df["row_id"] = [0, 1, 2]
+    calls = []
+
+    def call_counting_mock_api(row: Dict) -> AnyStr:
+        calls.append(row.get(INPUT_COLUMN))
+        return call_mock_api(row)
+
+    df = api_parallelizer(
+        input_df=input_df,
+        api_call_function=call_counting_mock_api,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=COLUMN_PREFIX,
+        deduplication_columns=[INPUT_COLUMN],
+    )
+    assert len(calls) == 2
+    assert list(df["row_id"]) == [0, 1, 2]
+    for i, test_case in enumerate(input_df[INPUT_COLUMN]):
+        output_dictionary = df.iloc[i, :].to_dict()
+        for k, v in test_case.value.items():
+            assert output_dictionary[k] == v
+
+
+def test_pack_batches_within_limits():
+    rows = [{"weight": w} for w in [60, 50, 40, 30, 20, 10, 10, 150]]
+    batches = list(
+        pack_batches(iter(rows), batch_size=3, max_batch_weight=100, row_weight_function=lambda r: r["weight"])
+    )
+    assert sorted(r["weight"] for batch in batches for r in batch) == sorted(r["weight"] for r in rows)
+    assert len(batches) == 4
+    for batch in batches:
+        assert len(batch) <= 3
+        assert len(batch) == 1 or sum(r["weight"] for r in batch) <= 100
+
+
+def test_api_input_columns_projection():
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS] * 3, "other_column": ["a", "b", "c"]})
+    rows = []
+
+    def call_recording_mock_api(row: Dict) -> AnyStr:
+        rows.append(row)
+        return call_mock_api(row)
+
+    df = api_parallelizer(
+        input_df=input_df,
+        api_call_function=call_recording_mock_api,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=COLUMN_PREFIX,
+        api_input_columns=[INPUT_COLUMN],
+    )
+    assert all("other_column" not in row for row in rows)
+    assert list(df["other_column"]) == ["a", "b", "c"]
+    assert all(df[COLUMN_PREFIX + "_response"] == APICaseEnum.SUCCESS.value[COLUMN_PREFIX + "_response"])
+
+
+def test_checkpoint_resumes_incomplete_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr("api_parallelizer.tqdm_auto", RecordingProgressBar)
+    RecordingProgressBar.instances.clear()
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS, APICaseEnum.API_FAILURE, APICaseEnum.SUCCESS]})
+    calls = []
+
+    def call_counting_mock_api(row: Dict) -> AnyStr:
+        calls.append(row.get(INPUT_COLUMN))
+        return call_mock_api(row)
+
+    for _ in range(2):  # Second run resumes from the journal of the first run, left incomplete
+        checkpoint_journal = CheckpointJournal(checkpoint_directory=tmp_path, run_id="test_run")
+        df = api_parallelizer(
+            input_df=input_df,
+            api_call_function=call_counting_mock_api,
+            api_exceptions=API_EXCEPTIONS,
+            column_prefix=COLUMN_PREFIX,
+            checkpoint_journal=checkpoint_journal,
+        )
+    assert len(calls) == 3 + 1  # Failed rows are not journaled, so they are sent again
+    assert [(p.total, p.n) for p in RecordingProgressBar.instances] == [(3, 3), (1, 1)]
+    for i, test_case in enumerate(input_df[INPUT_COLUMN]):
+        output_dictionary = df.iloc[i, :].to_dict()
+        for k, v in test_case.value.items():
+            assert output_dictionary[k] == v
+    checkpoint_journal.complete()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_checkpoint_ignores_results_of_other_parameters(tmp_path):
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS, APICaseEnum.API_FAILURE, APICaseEnum.SUCCESS]})
+    calls = []
+
+    def call_counting_mock_api(row: Dict, api_function_param: int) -> AnyStr:
+        calls.append(row.get(INPUT_COLUMN))
+        return call_mock_api(row, api_function_param)
+
+    for api_function_param in [42, 43, 43]:  # Results of the first run are not resumed with another parameter
+        api_parallelizer(
+            input_df=input_df,
+            api_call_function=call_counting_mock_api,
+            api_exceptions=API_EXCEPTIONS,
+            column_prefix=COLUMN_PREFIX,
+            checkpoint_journal=CheckpointJournal(checkpoint_directory=tmp_path, run_id="test_run"),
+            api_function_param=api_function_param,
+        )
+    assert len(calls) == 3 + 3 + 1
+
+
+def test_segments_are_sent_while_rows_are_read(monkeypatch):
+    monkeypatch.setattr("api_parallelizer.tqdm_auto", RecordingProgressBar)
+    RecordingProgressBar.instances.clear()
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS] * 20})
+    events = []
+
+    def split_in_two(row: Dict) -> List[Dict]:
+        events.append("split")
+        return [dict(row), dict(row)]
+
+    def call_recording_mock_api(row: Dict) -> AnyStr:
+        events.append("call")
+        return call_mock_api(row)
+
+    df = api_parallelizer(
+        input_df=input_df,
+        api_call_function=call_recording_mock_api,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=COLUMN_PREFIX,
+        parallel_workers=1,
+        split_function=split_in_two,
+        merge_function=lambda rows, responses: responses[0],
+    )
+    assert all(df[COLUMN_PREFIX + "_response"] == APICaseEnum.SUCCESS.value[COLUMN_PREFIX + "_response"])
+    assert events.index("call") < len(events) - 1 - events[::-1].index("split")  # rows are not read all at once
+    assert [(p.total, p.n) for p in RecordingProgressBar.instances] == [(40, 40)]
+
+
+def test_checkpoint_requires_directory():
+    for checkpoint_directory in [None, ""]:
+        with pytest.raises(ValueError, match="no checkpoint directory"):
+            CheckpointJournal(checkpoint_directory=checkpoint_directory, run_id="test_run")
+
+
+def test_adaptive_concurrency_and_batch_size(monkeypatch):
+    monkeypatch.setattr("api_parallelizer.tqdm_auto", RecordingProgressBar)
+    RecordingProgressBar.instances.clear()
+    input_df = pd.DataFrame({INPUT_COLUMN: [APICaseEnum.SUCCESS] * 100, "row_id": range(100)})
+    batch_sizes = []
+
+    def call_mock_batch_api(batch: List[Dict]) -> List[AnyStr]:
+        batch_sizes.append(len(batch))
+        return [call_mock_api(row) for row in batch]
+
+    def parse_mock_batch_response(batch: List[Dict], response: List[AnyStr], api_column_names) -> List[Dict]:
+        for row, row_response in zip(batch, response):
+            row.update({k: "" for k in api_column_names})
+            row[api_column_names.response] = row_response
+        return batch
+
+    concurrency_controller = AIMDConcurrencyController(
+        initial_concurrency=1,
+        max_concurrency=4,
+        initial_batch_size=2,
+        max_batch_size=8,
+        latency_tolerance=1e6,  # mock calls take microseconds, so their latency is only scheduling noise
+    )
+    df = api_parallelizer(
+        input_df=input_df,
+        api_call_function=call_mock_batch_api,
+        api_exceptions=API_EXCEPTIONS,
+        column_prefix=COLUMN_PREFIX,
+        api_support_batch=True,
+        batch_api_response_parser=parse_mock_batch_response,
+        concurrency_controller=concurrency_controller,
+    )
+    assert list(df["row_id"]) == list(range(100))
+    assert all(df[COLUMN_PREFIX + "_response"] == APICaseEnum.SUCCESS.value[COLUMN_PREFIX + "_response"])
+    assert concurrency_controller.concurrency == 4
+    assert batch_sizes[0] == 2 and max(batch_sizes) > 2
+    assert [(p.total, p.n) for p in RecordingProgressBar.instances] == [(100, 100)]
+
+
+def test_requeue_transient_errors_only():
+    input_df = pd.DataFrame({"text": ["ok", "flaky", "invalid", "ok", "flaky"], "row_id": range(5)})
+    sent_texts = []
+
+    def call_mock_batch_api(batch: List[Dict]) -> List[AnyStr]:
+        sent_texts.extend(row["text"] for row in batch)
+        return [row["text"] for row in batch]
+
+    def parse_mock_batch_response(batch: List[Dict], response: List[AnyStr], api_column_names) -> List[Dict]:
+        for row, text in zip(batch, response):
+            row.update({k: "" for k in api_column_names})
+            if text == "invalid" or (text == "flaky" and sent_texts.count("flaky") <= 2):
+                row[api_column_names.error_message] = text
+                row[api_column_names.error_type] = "InvalidDocument" if text == "invalid" else "ServiceUnavailable"
+            else:
+                row[api_column_names.response] = text
+        return batch
+
+    parallelizer_kwargs = {
+        "api_call_function": call_mock_batch_api,
+        "api_exceptions": API_EXCEPTIONS,
+        "column_prefix": COLUMN_PREFIX,
+        "api_support_batch": True,
+        "batch_size": 2,
+        "batch_api_response_parser": parse_mock_batch_response,
+        "transient_error_function": lambda error_type: error_type == "ServiceUnavailable",
+    }
+    df = api_parallelizer(input_df=input_df, **parallelizer_kwargs)
+    assert list(df[COLUMN_PREFIX + "_response"]) == ["ok", "flaky", "", "ok", "flaky"]
+    assert list(df[COLUMN_PREFIX + "_error_type"]) == ["", "", "InvalidDocument", "", ""]
+    assert str(df[COLUMN_PREFIX + "_error_type"].dtype) == STRING_DTYPE
+    assert sorted(sent_texts) == ["flaky"] * 4 + ["invalid", "ok", "ok"]  # successful rows are sent once
+    sent_texts.clear()
+    with pytest.raises(BatchAPIError, match="transient errors after 1 attempts"):
+        api_parallelizer(
+            input_df=input_df.iloc[[1]], error_handling=ErrorHandlingEnum.FAIL, max_attempts=1, **parallelizer_kwargs
+        )
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from time import monotonic
+
+from api_rate_limiter import TokenBucketRateLimiter, parse_retry_after, compute_backoff  # noqa
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_rate_limiter_paces_calls():
+    rate_limiter = TokenBucketRateLimiter(rate_limit=20, period=1)
+    start = monotonic()
+    for _ in range(5):
+        rate_limiter.acquire()
+    assert 0.15 <= monotonic() - start < 1
+
+
+def test_rate_limiter_pause():
+    rate_limiter = TokenBucketRateLimiter(rate_limit=1000, period=1)
+    rate_limiter.pause(0.2)
+    assert rate_limiter.acquire() > 0.1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"Retry-After": "3"}) == 3
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert parse_retry_after({"Retry-After": "invalid"}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_compute_backoff_is_capped():
+    assert all(0 <= compute_backoff(attempt, base=1, cap=4) <= 4 for attempt in range(10))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import os
+
+from api_response_cache import APIResponseCache  # noqa
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+SERVICE = "sentiment"
+DOCUMENT = {"id": "0", "text": "I love this plugin", "language": "en"}
+RESPONSE = {"sentiment": "positive", "confidenceScores": {"positive": 0.99, "neutral": 0.01, "negative": 0.0}}
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_cache_hit_ignores_document_id(tmpdir):
+    cache = APIResponseCache(api_version="v3.0", cache_path=os.path.join(str(tmpdir), "cache.sqlite"))
+    cache.set_many([(cache.compute_key(SERVICE, DOCUMENT), RESPONSE)])
+    key = cache.compute_key(SERVICE, {**DOCUMENT, "id": "42"})
+    assert cache.get_many([key]) == {key: RESPONSE}
+    assert cache.get_many([cache.compute_key(SERVICE, {**DOCUMENT, "language": "fr"})]) == {}
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_cache_invalidated_on_api_version_change(tmpdir):
+    cache_path = os.path.join(str(tmpdir), "cache.sqlite")
+    cache = APIResponseCache(api_version="v3.0", cache_path=cache_path)
+    cache.set_many([(cache.compute_key(SERVICE, DOCUMENT), RESPONSE)])
+    cache.close()
+    cache = APIResponseCache(api_version="v3.1", cache_path=cache_path)
+    cache.api_version = "v3.0"  # same key as before the version change
+    assert cache.get_many([cache.compute_key(SERVICE, DOCUMENT)]) == {}
+    cache.close()
+
+
+def test_cache_eviction_beyond_max_entries(tmpdir):
+    cache = APIResponseCache(api_version="v3.0", cache_path=os.path.join(str(tmpdir), "cache.sqlite"), max_entries=2)
+    keys = [cache.compute_key(SERVICE, {**DOCUMENT, "text": str(i)}) for i in range(3)]
+    for key in keys:
+        cache.set_many([(key, RESPONSE)])
+    cache.evict()
+    assert len(cache.get_many(keys)) == 2
+    cache.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import os
+import asyncio
+import sqlite3
+import threading
+from time import monotonic
+
+from api_shared_rate_limiter import SharedTokenBucketRateLimiter  # noqa
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_shared_rate_limiter_splits_quota(tmp_path):
+    store_path = os.path.join(str(tmp_path), "quota.sqlite")
+    # Two limiters on the same store behave like two processes sharing an API key
+    rate_limiters = [
+        SharedTokenBucketRateLimiter(rate_limit=20, period=1, quota_key="endpoint key", store_path=store_path)
+        for _ in range(2)
+    ]
+    other_rate_limiter = SharedTokenBucketRateLimiter(
+        rate_limit=20, period=1, quota_key="other endpoint key", store_path=store_path
+    )
+    start = monotonic()
+    for i in range(6):
+        rate_limiters[i % 2].acquire()
+    assert 0.2 <= monotonic() - start < 1
+    assert other_rate_limiter.acquire() == 0
+    for rate_limiter in rate_limiters + [other_rate_limiter]:
+        rate_limiter.close()
+
+
+def test_shared_rate_limiter_pause(tmp_path):
+    store_path = os.path.join(str(tmp_path), "quota.sqlite")
+    rate_limiters = [
+        SharedTokenBucketRateLimiter(rate_limit=1000, period=1, quota_key="endpoint key", store_path=store_path)
+        for _ in range(2)
+    ]
+    rate_limiters[0].pause(0.2)
+    assert rate_limiters[1].wait_time() > 0.1
+    assert rate_limiters[1].acquire() > 0.1
+    for rate_limiter in rate_limiters:
+        rate_limiter.close()
+
+
+def test_shared_rate_limiter_acquire_async_does_not_block_event_loop(tmp_path):
+    store_path = os.path.join(str(tmp_path), "quota.sqlite")
+    rate_limiter = SharedTokenBucketRateLimiter(
+        rate_limit=1000, period=1, quota_key="endpoint key", store_path=store_path
+    )
+    # Another process holds the bucket for 0.3 seconds
+    other_connection = sqlite3.connect(store_path, isolation_level=None, check_same_thread=False)
+    other_connection.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other_connection.execute, args=("COMMIT",)).start()
+    tick_times = []
+
+    async def tick():
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            tick_times.append(monotonic())
+
+    async def acquire():
+        await rate_limiter.acquire_async()
+        return monotonic()
+
+    async def acquire_while_ticking():
+        return await asyncio.gather(acquire(), tick())
+
+    loop = asyncio.new_event_loop()
+    try:
+        acquired_at, _ = loop.run_until_complete(acquire_while_ticking())
+    finally:
+        loop.close()
+    assert len(tick_times) == 5 and max(tick_times) < acquired_at
+    other_connection.close()
+    rate_limiter.close()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import json
+
+import pytest
+import pandas as pd
+
+from api_telemetry import APITelemetry, LatencyHistogram  # noqa
+from api_parallelizer import api_parallelizer  # noqa
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for latency_ms in [3] * 90 + [40] * 9 + [700]:
+        histogram.add(latency_ms / 1000.0)
+    summary = histogram.to_dict()
+    assert summary["count"] == 100
+    assert (summary["p50_ms"], summary["p90_ms"], summary["p99_ms"]) == (5, 5, 50)
+    assert summary["max_ms"] == pytest.approx(700)
+    assert sum(bucket["count"] for bucket in summary["buckets"]) == 100
+
+
+def test_telemetry_tracks_requests_and_exceptions():
+    telemetry = APITelemetry(sample_interval=0)
+    data = {"documents": [{"id": "0", "text": "hello"}, {"id": "1", "text": "world!"}]}
+    with telemetry.track_request(data) as request:
+        request["status"] = 429
+    with pytest.raises(ConnectionError):
+        with telemetry.track_request(data, attempt=1):
+            raise ConnectionError
+    telemetry.record_rate_limit_wait(0.5)
+    report = json.loads(json.dumps(telemetry.report()))
+    assert report["requests"]["status_counts"] == {"429": 1, "ConnectionError": 1}
+    assert (report["requests"]["documents"], report["requests"]["characters"]) == (4, 22)
+    assert report["requests"]["retries"] == 1
+    assert report["rate_limit"] == {"waits": 1, "wait_seconds": 0.5}
+    assert telemetry.in_flight == 0
+    assert report["concurrency"]["max_in_flight"] == 1
+
+
+def test_api_parallelizer_records_calls():
+    telemetry = APITelemetry()
+    input_df = pd.DataFrame({"text": ["a", "b", "c", "d", "e"]})
+    api_parallelizer(
+        input_df=input_df,
+        api_call_function=lambda batch: [{"id": str(i)} for i in range(len(batch))],
+        api_exceptions=ValueError,
+        column_prefix="test_api",
+        api_support_batch=True,
+        batch_size=2,
+        batch_api_response_parser=lambda batch, response, api_column_names: [
+            {**row, **{k: "" for k in api_column_names}, api_column_names.response: "ok"} for row in batch
+        ],
+        telemetry=telemetry,
+    )
+    report = telemetry.report()
+    assert (report["rows"]["completed"], report["rows"]["failed"], report["rows"]["sent"]) == (5, 0, 5)
+    assert report["calls"]["count"] == 3
+
+
+def test_api_parallelizer_records_final_row_outcomes():
+    telemetry = APITelemetry()
+    input_df = pd.DataFrame({"text": ["flaky", "invalid", "flaky ", "ok"]})
+    sent_texts = []
+
+    def parse_response(batch, response, api_column_names):
+        for row in batch:
+            sent_texts.append(row["text"])
+            row.update({k: "" for k in api_column_names})
+            if row["text"] == "invalid":
+                row[api_column_names.error_type] = "InvalidDocument"
+            elif row["text"] == "flaky" and sent_texts.count("flaky") == 1:
+                row[api_column_names.error_type] = "Throttled"
+            else:
+                row[api_column_names.response] = "ok"
+        return batch
+
+    for _ in range(2):  # two chunks
+        api_parallelizer(
+            input_df=input_df,
+            api_call_function=lambda batch: batch,
+            api_exceptions=ValueError,
+            column_prefix="test_api",
+            api_support_batch=True,
+            batch_size=2,
+            batch_api_response_parser=parse_response,
+            deduplication_columns=["text"],
+            transient_error_function=lambda error_type: error_type == "Throttled",
+            telemetry=telemetry,
+        )
+    report = telemetry.report()
+    # the transient error of the first chunk is not counted as a failure once its row succeeds
+    assert (report["rows"]["completed"], report["rows"]["failed"], report["rows"]["sent"]) == (8, 2, 7)
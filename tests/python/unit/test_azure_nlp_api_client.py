@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from plugin_io_utils import build_unique_column_names  # noqa
+from azure_nlp_api_client import AzureNLPAPIWrapper, batch_api_response_parser, is_transient_api_error  # noqa
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+API_COLUMN_NAMES = build_unique_column_names([], "test_api")
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_batch_api_response_parser_non_contiguous_ids():
+    batch = [{"text": str(i)} for i in range(4)]
+    response = {
+        "documents": [{"id": "3", "keyPhrases": ["c"]}, {"id": 0, "keyPhrases": ["a"]}],
+        "errors": [{"id": "2", "error": {"code": "InvalidArgument", "innererror": {"code": "InvalidDocument"}}}],
+    }
+    batch = batch_api_response_parser(batch=batch, response=response, api_column_names=API_COLUMN_NAMES)
+    assert batch[0][API_COLUMN_NAMES.response] == {"id": 0, "keyPhrases": ["a"]}
+    assert batch[1][API_COLUMN_NAMES.response] == ""
+    assert batch[1][API_COLUMN_NAMES.error_type] == ""
+    assert batch[2][API_COLUMN_NAMES.error_type] == "InvalidDocument"
+    assert batch[3][API_COLUMN_NAMES.response]["keyPhrases"] == ["c"]
+
+
+def test_batch_api_response_parser_whole_batch_error():
+    batch = [{"text": str(i)} for i in range(2)]
+    response = {"error": {"code": "401", "message": "Access denied"}}
+    batch = batch_api_response_parser(batch=batch, response=response, api_column_names=API_COLUMN_NAMES)
+    for row in batch:
+        assert row[API_COLUMN_NAMES.response] == ""
+        assert row[API_COLUMN_NAMES.error_message] == "Access denied"
+        assert row[API_COLUMN_NAMES.error_type] == "401"
+
+
+def test_is_transient_api_error():
+    assert is_transient_api_error("ServiceUnavailable")
+    assert is_transient_api_error("429")
+    assert is_transient_api_error("requests.exceptions.ReadTimeout")
+    assert not is_transient_api_error("InvalidDocument")
+    assert not is_transient_api_error("UnsupportedLanguageCode")
+    assert not is_transient_api_error("")
+
+
+def test_build_concurrency_controller_within_max_concurrency():
+    api_wrapper = AzureNLPAPIWrapper(
+        {"azure_api_key": "key", "azure_region": "eastus", "parallel_workers": 8, "adaptive_concurrency": True}
+    )
+    assert api_wrapper.build_concurrency_controller(batch_size=10).max_concurrency == 8
+    assert api_wrapper.build_concurrency_controller(batch_size=10, max_concurrency=2).max_concurrency == 2
+    assert api_wrapper.build_concurrency_controller(batch_size=10, max_concurrency=16).max_concurrency == 8
+    api_wrapper.close()
+
+
+def test_concurrency_controller_sees_throttling_of_all_endpoints():
+    api_wrapper = AzureNLPAPIWrapper(
+        {
+            "azure_api_key": "key",
+            "azure_region": "eastus",
+            "parallel_workers": 8,
+            "adaptive_concurrency": True,
+            "additional_endpoints": [{"azure_api_key": "other_key", "azure_region": "westus"}],
+        }
+    )
+    controller = api_wrapper.build_concurrency_controller(batch_size=10)
+    for _ in range(4):
+        controller.record(0.1)
+    assert controller.concurrency == 2
+    api_wrapper.endpoint_pool.endpoints[1].rate_limiter.pause(0)
+    for _ in range(4):
+        controller.record(0.1)
+    assert controller.concurrency == 1
+    api_wrapper.close()
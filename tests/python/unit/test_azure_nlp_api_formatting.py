@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+import json
+
+import pandas as pd
+
+from plugin_io_utils import build_unique_column_names, move_api_columns_to_end  # noqa
+from azure_nlp_api_formatting import (  # noqa
+    EntityTypeEnum,
+    LanguageDetectionAPIFormatter,
+    SentimentAnalysisAPIFormatter,
+    NamedEntityRecognitionAPIFormatter,
+    PIIExtractionAPIFormatter,
+    KeyPhraseExtractionAPIFormatter,
+    FormattingProcessPool,
+    MIN_ROWS_PER_PROCESS,
+    RedactionModeEnum,
+    redact_text,
+)
+from azure_nlp_api_segmentation import split_row, merge_segment_responses  # noqa
+
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+TEXT_COLUMN = "text"
+INPUT_DF = pd.DataFrame({TEXT_COLUMN: ["Call John Smith at 555-0100 in Paris", "Nothing to see", "Broken response"]})
+RESPONSES = [
+    {
+        "id": "0",
+        "detectedLanguage": {"name": "English", "iso6391Name": "en", "confidenceScore": 0.99},
+        "sentiment": "neutral",
+        "confidenceScores": {"positive": 0.1234, "neutral": 0.8, "negative": 0.0766},
+        "keyPhrases": ["John Smith", "Paris"],
+        "entities": [
+            {"text": "John Smith", "category": "Person", "offset": 5, "length": 10, "confidenceScore": 0.9},
+            {"text": "555-0100", "category": "PhoneNumber", "offset": 19, "length": 8, "confidenceScore": 0.8},
+            {"text": "Paris", "category": "Location", "offset": 31, "length": 5, "confidenceScore": 0.3},
+        ],
+    },
+    {"id": "1", "entities": [], "keyPhrases": []},
+    None,
+]
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def build_api_results_df(column_prefix: str) -> pd.DataFrame:
+    api_column_names = build_unique_column_names(INPUT_DF.columns, column_prefix)
+    df = INPUT_DF.copy()
+    df[api_column_names.response] = [json.dumps(r) if r is not None else "" for r in RESPONSES]
+    for column_name in api_column_names[1:]:
+        df[column_name] = ""
+    return df
+
+
+def assert_format_df_matches_format_row(api_formatter) -> None:
+    df = build_api_results_df(api_formatter.column_prefix)
+    expected_df = move_api_columns_to_end(
+        df.copy().apply(func=api_formatter.format_row, axis=1), api_formatter.api_column_names
+    )
+    output_df = api_formatter.format_df(df)
+    assert list(output_df.columns) == list(expected_df.columns)
+    for column_name in api_formatter.format_columns(df, api_formatter.decode_responses(df)):
+        dtype = api_formatter.column_dtype_dict.get(column_name)
+        if dtype is not None:
+            assert str(output_df[column_name].dtype) == dtype
+            expected_df[column_name] = expected_df[column_name].astype(dtype)
+    for column_name in output_df.columns:
+        for value, expected_value in zip(output_df[column_name], expected_df[column_name]):
+            assert value == expected_value or (pd.isnull(value) and pd.isnull(expected_value))
+
+
+def test_language_detection_format_df():
+    assert_format_df_matches_format_row(LanguageDetectionAPIFormatter(input_df=INPUT_DF))
+
+
+def test_sentiment_analysis_format_df():
+    assert_format_df_matches_format_row(SentimentAnalysisAPIFormatter(input_df=INPUT_DF))
+
+
+def test_named_entity_recognition_format_df():
+    api_formatter = NamedEntityRecognitionAPIFormatter(
+        input_df=INPUT_DF, entity_types=list(EntityTypeEnum), minimum_score=0.5
+    )
+    assert_format_df_matches_format_row(api_formatter)
+
+
+def test_pii_extraction_format_df():
+    api_formatter = PIIExtractionAPIFormatter(input_df=INPUT_DF, text_column=TEXT_COLUMN, minimum_score=0.5)
+    assert_format_df_matches_format_row(api_formatter)
+
+
+def test_pii_extraction_redacts_stripped_text():
+    # offsets returned by the API, and shifted when segments are merged, are relative to the stripped text
+    text = "  Call John Smith. " + "Nothing to see here. " * 5 + "Reach 555-0100 today.\n"
+    segment_rows = split_row({TEXT_COLUMN: text}, TEXT_COLUMN, max_characters=60)
+    assert len(segment_rows) > 1
+    responses = []
+    for i, segment_row in enumerate(segment_rows):
+        segment = segment_row[TEXT_COLUMN].strip()
+        entities = [
+            {"text": e, "category": "PII", "offset": segment.find(e), "length": len(e), "confidenceScore": 0.9}
+            for e in ["John Smith", "555-0100"]
+            if e in segment
+        ]
+        responses.append({"id": str(i), "entities": entities})
+    response = merge_segment_responses(segment_rows, responses, "entities/recognition/pii", TEXT_COLUMN)
+    api_formatter = PIIExtractionAPIFormatter(
+        input_df=pd.DataFrame({TEXT_COLUMN: [text]}),
+        text_column=TEXT_COLUMN,
+        minimum_score=0.5,
+        redaction_mode=RedactionModeEnum.MASK,
+        redaction_mask="***",
+    )
+    df = pd.DataFrame({TEXT_COLUMN: [text], api_formatter.api_column_names.response: [json.dumps(response)]})
+    for column_name in api_formatter.api_column_names[1:]:
+        df[column_name] = ""
+    output_df = api_formatter.format_df(df)
+    expected_text = "Call ***. " + "Nothing to see here. " * 5 + "Reach *** today."
+    assert output_df[api_formatter.pii_column_redacted][0] == expected_text
+    assert api_formatter.format_row(df.iloc[0].to_dict())[api_formatter.pii_column_redacted] == expected_text
+
+
+def test_key_phrase_extraction_format_df():
+    assert_format_df_matches_format_row(KeyPhraseExtractionAPIFormatter(input_df=INPUT_DF, num_key_phrases=3))
+
+
+def test_format_df_serializes_decoded_responses():
+    api_formatter = KeyPhraseExtractionAPIFormatter(input_df=INPUT_DF, num_key_phrases=1)
+    df = build_api_results_df(api_formatter.column_prefix)
+    df[api_formatter.api_column_names.response] = [r if r is not None else "" for r in RESPONSES]
+    output_df = api_formatter.format_df(df)
+    assert output_df[api_formatter.keyphrase_columns[0]].tolist() == ["John Smith", "", ""]
+    assert json.loads(output_df[api_formatter.api_column_names.response][0]) == RESPONSES[0]
+    assert output_df[api_formatter.api_column_names.response][2] == ""
+
+
+def test_format_df_in_process_pool():
+    api_formatters = [
+        PIIExtractionAPIFormatter(input_df=INPUT_DF, text_column=TEXT_COLUMN, minimum_score=0.5),
+        NamedEntityRecognitionAPIFormatter(input_df=INPUT_DF, entity_types=list(EntityTypeEnum), minimum_score=0.5),
+    ]
+    process_pool = FormattingProcessPool(num_processes=2)
+    try:
+        for api_formatter in api_formatters:
+            df = build_api_results_df(api_formatter.column_prefix)
+            df = pd.concat([df] * MIN_ROWS_PER_PROCESS, ignore_index=True)
+            expected_df = api_formatter.format_df(df)
+            output_df = api_formatter.format_df(df, process_pool=process_pool)
+            assert output_df.equals(expected_df)
+    finally:
+        process_pool.close()
+
+
+def test_redact_text_merges_overlapping_spans():
+    text = "Call John Smith at 555-0100"
+    entities = [
+        {"category": "PhoneNumber", "offset": 19, "length": 8},
+        {"category": "Person", "offset": 5, "length": 10},
+        {"category": "PersonType", "offset": 5, "length": 4},
+        {"category": "Person", "offset": 10, "length": 5},
+    ]
+    assert redact_text(text, entities) == "Call  at "
+    assert redact_text(text, entities, RedactionModeEnum.MASK, "***") == "Call *** at ***"
+    assert redact_text(text, entities, RedactionModeEnum.CATEGORY) == "Call [Person] at [PhoneNumber]"
+    assert redact_text(text, [{"category": "Person", "offset": 20, "length": 50}]) == "Call John Smith at 5"
+
+
+def test_named_entity_recognition_format_long_df():
+    api_formatter = NamedEntityRecognitionAPIFormatter(
+        input_df=INPUT_DF, entity_types=list(EntityTypeEnum), minimum_score=0.5, wide_output=False, row_id_output=True
+    )
+    df = build_api_results_df(api_formatter.column_prefix)
+    df.index = pd.RangeIndex(10, 10 + len(df.index))
+    long_df = api_formatter.format_long_df(df)
+    assert list(long_df.columns) == [api_formatter.row_id_column] + list(api_formatter.long_column_description_dict)[1:]
+    assert long_df[api_formatter.row_id_column].tolist() == [10, 10]
+    assert long_df["text"].tolist() == ["John Smith", "555-0100"]
+    assert str(long_df["offset"].dtype) == "int32" and str(long_df["confidence_score"].dtype) == "float32"
+    assert str(long_df["category"].dtype) == "category"
+    output_df = api_formatter.format_df(df)
+    assert output_df[api_formatter.row_id_column].tolist() == [10, 11, 12]
+    assert not any(column.startswith("entity_api_entity_type_") for column in output_df.columns)
+    empty_long_df = api_formatter.format_long_df(df.iloc[1:])
+    assert len(empty_long_df.index) == 0 and str(empty_long_df["offset"].dtype) == "int32"
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# This is a test file intended to be used with pytest
+# pytest automatically runs all the function starting with "test_"
+# see https://docs.pytest.org for more information
+
+from azure_nlp_api_segmentation import split_text, split_row, merge_segment_responses  # noqa
+
+# ==============================================================================
+# CONSTANT DEFINITION
+# ==============================================================================
+
+TEXT = "Alice lives in Paris. She works at Contoso!\nBob moved to Lyon last year, and he likes it."
+
+
+# ==============================================================================
+# CLASS AND FUNCTION DEFINITION
+# ==============================================================================
+
+
+def test_split_text_at_sentence_boundaries():
+    segments = split_text(TEXT, max_characters=50)
+    assert [segment for _, segment in segments] == [
+        "Alice lives in Paris. She works at Contoso!\n",
+        "Bob moved to Lyon last year, and he likes it.",
+    ]
+    assert all(TEXT[offset : offset + len(segment)] == segment for offset, segment in segments)
+    assert [segment for _, segment in split_text("a" * 25 + " " + "b" * 30, max_characters=20)] == [
+        "a" * 20,
+        "a" * 5 + " ",
+        "b" * 20,
+        "b" * 10,
+    ]
+
+
+def test_merge_segment_responses():
+    segment_rows = split_row({"text": "  " + TEXT + " "}, text_column="text", max_characters=50)
+    assert [row["__segment_offset__"] for row in segment_rows] == [0, 44]
+    entities = merge_segment_responses(
+        segment_rows,
+        [
+            {"id": "0", "entities": [{"text": "Paris", "offset": 15, "length": 5}], "redactedText": "x" * 43},
+            {"id": "1", "entities": [{"text": "Lyon", "offset": 13, "length": 4}], "redactedText": "y" * 45},
+        ],
+        service="entities/recognition/pii",
+        text_column="text",
+    )
+    assert [TEXT[e["offset"] : e["offset"] + e["length"]] for e in entities["entities"]] == ["Paris", "Lyon"]
+    assert entities["redactedText"] == "x" * 43 + "\n" + "y" * 45
+    key_phrases = merge_segment_responses(
+        segment_rows,
+        [{"keyPhrases": ["Alice", "Paris", "Contoso"]}, {"keyPhrases": ["Bob", "paris"]}],
+        service="keyPhrases",
+        text_column="text",
+    )
+    assert key_phrases["keyPhrases"] == ["Alice", "Bob", "Paris", "Contoso"]
+    sentiment = merge_segment_responses(
+        segment_rows,
+        [
+            {"sentiment": "neutral", "confidenceScores": {"positive": 0.0, "neutral": 1.0, "negative": 0.0}},
+            {"sentiment": "positive", "confidenceScores": {"positive": 1.0, "neutral": 0.0, "negative": 0.0}},
+        ],
+        service="sentiment",
+        text_column="text",
+    )
+    assert sentiment["sentiment"] == "positive"
+    assert sentiment["confidenceScores"] == {"positive": 0.51, "neutral": 0.49, "negative": 0.0}